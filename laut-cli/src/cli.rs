@@ -7,6 +7,7 @@
 use std::path::PathBuf;
 
 use clap::{Args, Parser, Subcommand};
+use laut_sign::trace_encoding::Encoding;
 
 #[derive(Debug, Parser)]
 #[command(name = "laut", about = "Nix build trace signature tool", version)]
@@ -68,6 +69,13 @@ pub struct SignAndUploadArgs {
     /// Embed the resolved ATerm preimage in the signed JWS debug block.
     #[arg(long)]
     pub include_preimage: bool,
+
+    /// Content encoding for the uploaded traces body: `gzip`, `zstd`, or
+    /// `identity`. Sent as `Content-Encoding` so the cache can hand it back
+    /// to verifiers as-is. Compression is opt-in: caches that drop the header
+    /// would serve bodies older signers and verifiers can't read.
+    #[arg(long, default_value = "identity")]
+    pub trace_encoding: Encoding,
 }
 
 #[cfg(feature = "verify")]
@@ -86,14 +94,20 @@ pub struct VerifyArgs {
     pub trusted_key: Vec<PathBuf>,
 
     /// Cache URL to scan for signer-side debug preimages. When a
-    /// resolved-input-hash lookup misses, runs difft against any preimage
-    /// with a matching drv-name. Requires the cache to expose a
-    /// `GET /traces/` listing endpoint; production caches will refuse.
+    /// resolved-input-hash lookup misses, prints a field-level ATerm diff
+    /// against any preimage with a matching drv-name, most similar first.
+    /// Requires the cache to expose a `GET /traces/` listing endpoint;
+    /// production caches will refuse.
     #[arg(long)]
     pub debug_preimage_corpus: Option<String>,
 
-    /// Directory to drop preimage artifacts into for `--debug-preimage-corpus`.
+    /// Use the external `difft` tool instead of the built-in ATerm diff for
+    /// `--debug-preimage-corpus`, writing preimage artifacts to disk.
+    #[arg(long, requires = "debug_preimage_corpus")]
+    pub debug_difft: bool,
+
+    /// Directory to drop preimage artifacts into for `--debug-difft`.
     /// Defaults to a temp dir.
-    #[arg(long)]
+    #[arg(long, requires = "debug_difft")]
     pub debug_out_dir: Option<PathBuf>,
 }
@@ -39,7 +39,7 @@ pub fn run_sign_and_upload(args: SignAndUploadArgs) -> Result<ExitCode, Error> {
         secret_key_file: args.secret_key_file,
         include_preimage: args.include_preimage,
     };
-    sign::sign_and_upload(&cfg, &args.to)?;
+    sign::sign_and_upload(&cfg, &args.to, args.trace_encoding)?;
     Ok(ExitCode::SUCCESS)
 }
 
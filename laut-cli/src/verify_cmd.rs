@@ -10,7 +10,9 @@ use std::path::Path;
 use std::process::{Command, ExitCode};
 
 use laut_verify::backend::RealBackend;
-use laut_verify::debug::{build_corpus_from_cache, DebugProbe, DifftProbe, NullProbe};
+use laut_verify::debug::{
+    build_corpus_from_cache, AtermDiffProbe, DebugProbe, DifftProbe, NullProbe,
+};
 use laut_verify::keyfiles;
 use laut_verify::orchestrator::{Config, Orchestrator};
 
@@ -50,7 +52,7 @@ pub fn run(args: VerifyArgs) -> Result<ExitCode, Error> {
     let drv_path = resolve_target(&args.target)?;
 
     let probe: Box<dyn DebugProbe> = match &args.debug_preimage_corpus {
-        Some(corpus_url) => {
+        Some(corpus_url) if args.debug_difft => {
             let index = build_corpus_from_cache(corpus_url)?;
             let out_dir = args
                 .debug_out_dir
@@ -58,6 +60,7 @@ pub fn run(args: VerifyArgs) -> Result<ExitCode, Error> {
                 .unwrap_or_else(std::env::temp_dir);
             Box::new(DifftProbe::new(index, out_dir)?)
         }
+        Some(corpus_url) => Box::new(AtermDiffProbe::new(build_corpus_from_cache(corpus_url)?)),
         None => Box::new(NullProbe),
     };
 
@@ -4,9 +4,15 @@
 //! `If-Match`. Concurrent uploads from other builders for the same input hash
 //! collide on the cache file and are detected via 412 Precondition Failed;
 //! the retry loop then GETs the now-populated traces file and appends.
+//!
+//! Bodies are stored in the caller's [`Encoding`] and marked with a
+//! `Content-Encoding` header; reads negotiate via `Accept-Encoding` and
+//! decode whatever the cache sends back.
 
 use serde_json::{Value, json};
 
+use crate::trace_encoding::{self, Encoding};
+
 const MAX_RETRIES: u32 = 5;
 
 #[derive(Debug, thiserror::Error)]
@@ -21,6 +27,8 @@ pub enum Error {
     Json(#[from] serde_json::Error),
     #[error("io error: {0}")]
     Io(#[from] std::io::Error),
+    #[error("{0}")]
+    Encoding(#[from] trace_encoding::Error),
     #[error("exceeded {0} retries while uploading signature")]
     MaxRetries(u32),
 }
@@ -53,15 +61,20 @@ pub fn parse_http_cache_url(store_url: &str) -> Result<String, Error> {
 }
 
 /// Fetch existing `{ "signatures": [...] }` plus its ETag, or `None` on 404.
+/// The body is decoded per the response's `Content-Encoding` as it streams in.
 fn get_existing(url: &str) -> Result<Option<(Value, String)>, Error> {
-    match ureq::get(url).call() {
+    match ureq::get(url)
+        .set("Accept-Encoding", trace_encoding::ACCEPT_ENCODING)
+        .call()
+    {
         Ok(resp) => {
             let etag = resp
                 .header("ETag")
                 .map(|s| s.trim_matches('"').to_owned())
                 .unwrap_or_default();
-            let body = resp.into_string()?;
-            let content: Value = serde_json::from_str(&body)?;
+            let encoding = Encoding::from_content_encoding(resp.header("Content-Encoding"))?;
+            let reader = encoding.decoder(resp.into_reader())?;
+            let content: Value = serde_json::from_reader(reader)?;
             Ok(Some((content, etag)))
         }
         Err(ureq::Error::Status(404, _)) => Ok(None),
@@ -69,10 +82,34 @@ fn get_existing(url: &str) -> Result<Option<(Value, String)>, Error> {
     }
 }
 
-/// Upload `signature` to `<store_url>/traces/<input_hash>`. If another builder
-/// is publishing the same input hash concurrently, ETag-based optimistic
-/// concurrency merges the lists across retries.
-pub fn upload_signature(store_url: &str, input_hash: &str, signature: &str) -> Result<(), Error> {
+/// Conditional PUT of a `{ "signatures": [...] }` body in `encoding`.
+/// `precondition` is the `(header, value)` pair guarding the write.
+fn put_signatures(
+    url: &str,
+    signatures: &Value,
+    precondition: (&str, &str),
+    encoding: Encoding,
+) -> Result<Result<ureq::Response, ureq::Error>, Error> {
+    let body = encoding.encode(json!({ "signatures": signatures }).to_string().as_bytes())?;
+    let mut request = ureq::request("PUT", url)
+        .set("Content-Type", "application/json")
+        .set(precondition.0, precondition.1);
+    if let Some(content_encoding) = encoding.content_encoding() {
+        request = request.set("Content-Encoding", content_encoding);
+    }
+    Ok(request.send_bytes(&body))
+}
+
+/// Upload `signature` to `<store_url>/traces/<input_hash>`, stored in
+/// `encoding`. If another builder is publishing the same input hash
+/// concurrently, ETag-based optimistic concurrency merges the lists across
+/// retries.
+pub fn upload_signature(
+    store_url: &str,
+    input_hash: &str,
+    signature: &str,
+    encoding: Encoding,
+) -> Result<(), Error> {
     let base_url = parse_http_cache_url(store_url)?;
     let url = format!("{}/traces/{}", base_url, input_hash);
 
@@ -82,11 +119,7 @@ pub fn upload_signature(store_url: &str, input_hash: &str, signature: &str) -> R
                 // No traces file yet — conditional create. If a concurrent
                 // builder created it between our GET and PUT, the server
                 // returns 412 and we retry through the merge path.
-                let body = json!({ "signatures": [signature] }).to_string();
-                ureq::request("PUT", &url)
-                    .set("Content-Type", "application/json")
-                    .set("If-None-Match", "*")
-                    .send_string(&body)
+                put_signatures(&url, &json!([signature]), ("If-None-Match", "*"), encoding)?
             }
             Some((content, etag)) => {
                 let mut signatures: Vec<Value> = content
@@ -98,11 +131,12 @@ pub fn upload_signature(store_url: &str, input_hash: &str, signature: &str) -> R
                     return Ok(());
                 }
                 signatures.push(Value::String(signature.to_owned()));
-                let body = json!({ "signatures": signatures }).to_string();
-                ureq::request("PUT", &url)
-                    .set("Content-Type", "application/json")
-                    .set("If-Match", &format!("\"{}\"", etag))
-                    .send_string(&body)
+                put_signatures(
+                    &url,
+                    &Value::Array(signatures),
+                    ("If-Match", &format!("\"{}\"", etag)),
+                    encoding,
+                )?
             }
         };
 
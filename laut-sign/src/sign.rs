@@ -19,6 +19,7 @@ use crate::http_cache;
 use crate::keyfiles;
 use crate::nix_cmd;
 use crate::store_path;
+use crate::trace_encoding::Encoding;
 
 pub mod jws;
 pub mod nix_version;
@@ -171,11 +172,11 @@ pub fn sign(cfg: &SignConfig) -> Result<Option<(String, String)>, Error> {
     Ok(Some((input_hash, jws_token)))
 }
 
-/// Sign and POST to the given HTTP cache. Silently no-ops on the same
-/// "out of scope" cases as [`sign`].
-pub fn sign_and_upload(cfg: &SignConfig, to: &str) -> Result<(), Error> {
+/// Sign and POST to the given HTTP cache, storing the traces body in
+/// `encoding`. Silently no-ops on the same "out of scope" cases as [`sign`].
+pub fn sign_and_upload(cfg: &SignConfig, to: &str, encoding: Encoding) -> Result<(), Error> {
     if let Some((input_hash, jws_token)) = sign(cfg)? {
-        http_cache::upload_signature(to, &input_hash, &jws_token)?;
+        http_cache::upload_signature(to, &input_hash, &jws_token, encoding)?;
     }
     Ok(())
 }
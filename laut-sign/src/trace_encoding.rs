@@ -0,0 +1,159 @@
+//! Content encodings for `traces/<input_hash>` bodies.
+//!
+//! Trace bodies are JSON arrays of JWS compact strings; with
+//! `--include-preimage` every JWS carries a base64'd ATerm, so they compress
+//! very well. Signers upload with a `Content-Encoding` header, verifiers send
+//! `Accept-Encoding` and decode per the response header, and on-disk caches
+//! keep compressed bodies as `<input_hash>.zst` / `<input_hash>.gz` siblings.
+
+use std::io::{self, Read, Write};
+use std::str::FromStr;
+
+/// `Accept-Encoding` value sent by every trace reader.
+pub const ACCEPT_ENCODING: &str = "zstd, gzip";
+
+/// zstd level for uploads. Trace bodies are small; higher levels buy little.
+const ZSTD_LEVEL: i32 = 9;
+
+#[derive(Debug, thiserror::Error)]
+pub enum Error {
+    #[error("unsupported content encoding {0:?} (expected identity, gzip, or zstd)")]
+    Unsupported(String),
+    #[error("io error: {0}")]
+    Io(#[from] io::Error),
+}
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq, Default)]
+pub enum Encoding {
+    #[default]
+    Identity,
+    Gzip,
+    Zstd,
+}
+
+impl Encoding {
+    /// Every encoding, in the order on-disk siblings are probed.
+    pub const ALL: [Encoding; 3] = [Encoding::Identity, Encoding::Zstd, Encoding::Gzip];
+
+    /// Interpret a response's `Content-Encoding` header. A missing header is
+    /// identity.
+    pub fn from_content_encoding(header: Option<&str>) -> Result<Self, Error> {
+        match header.map(str::trim) {
+            None | Some("") => Ok(Encoding::Identity),
+            Some(value) => value.parse(),
+        }
+    }
+
+    /// Value for the `Content-Encoding` header, `None` for identity.
+    pub fn content_encoding(self) -> Option<&'static str> {
+        match self {
+            Encoding::Identity => None,
+            Encoding::Gzip => Some("gzip"),
+            Encoding::Zstd => Some("zstd"),
+        }
+    }
+
+    /// File-name suffix for an on-disk copy in this encoding.
+    pub fn file_suffix(self) -> &'static str {
+        match self {
+            Encoding::Identity => "",
+            Encoding::Gzip => ".gz",
+            Encoding::Zstd => ".zst",
+        }
+    }
+
+    /// Guess the encoding of an on-disk trace file from its suffix.
+    pub fn from_file_name(name: &str) -> Self {
+        Encoding::ALL
+            .into_iter()
+            .find(|e| !e.file_suffix().is_empty() && name.ends_with(e.file_suffix()))
+            .unwrap_or(Encoding::Identity)
+    }
+
+    pub fn encode(self, body: &[u8]) -> Result<Vec<u8>, Error> {
+        match self {
+            Encoding::Identity => Ok(body.to_vec()),
+            Encoding::Gzip => {
+                let mut enc =
+                    flate2::write::GzEncoder::new(Vec::new(), flate2::Compression::default());
+                enc.write_all(body)?;
+                Ok(enc.finish()?)
+            }
+            Encoding::Zstd => Ok(zstd::stream::encode_all(body, ZSTD_LEVEL)?),
+        }
+    }
+
+    /// Wrap `reader` in a streaming decoder for this encoding.
+    pub fn decoder<'a, R: Read + 'a>(self, reader: R) -> Result<Box<dyn Read + 'a>, Error> {
+        Ok(match self {
+            Encoding::Identity => Box::new(reader),
+            Encoding::Gzip => Box::new(flate2::read::GzDecoder::new(reader)),
+            Encoding::Zstd => Box::new(zstd::stream::read::Decoder::new(reader)?),
+        })
+    }
+
+    /// Decode all of `reader` into memory.
+    pub fn decode_all<R: Read>(self, reader: R) -> Result<Vec<u8>, Error> {
+        let mut buf = Vec::new();
+        self.decoder(reader)?.read_to_end(&mut buf)?;
+        Ok(buf)
+    }
+}
+
+impl FromStr for Encoding {
+    type Err = Error;
+
+    fn from_str(s: &str) -> Result<Self, Error> {
+        match s.trim().to_ascii_lowercase().as_str() {
+            "identity" | "none" => Ok(Encoding::Identity),
+            "gzip" | "x-gzip" => Ok(Encoding::Gzip),
+            "zstd" => Ok(Encoding::Zstd),
+            other => Err(Error::Unsupported(other.to_owned())),
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    const BODY: &[u8] = br#"{"signatures":["a.b.c","d.e.f"]}"#;
+
+    #[test]
+    fn round_trips_every_encoding() {
+        for enc in Encoding::ALL {
+            let encoded = enc.encode(BODY).unwrap();
+            assert_eq!(
+                enc.decode_all(encoded.as_slice()).unwrap(),
+                BODY,
+                "{:?}",
+                enc
+            );
+        }
+    }
+
+    #[test]
+    fn missing_header_is_identity() {
+        assert_eq!(
+            Encoding::from_content_encoding(None).unwrap(),
+            Encoding::Identity
+        );
+        assert_eq!(
+            Encoding::from_content_encoding(Some(" zstd ")).unwrap(),
+            Encoding::Zstd
+        );
+    }
+
+    #[test]
+    fn file_name_suffix_selects_encoding() {
+        assert_eq!(Encoding::from_file_name("abc.zst"), Encoding::Zstd);
+        assert_eq!(Encoding::from_file_name("abc.gz"), Encoding::Gzip);
+        assert_eq!(Encoding::from_file_name("abc"), Encoding::Identity);
+    }
+
+    #[test]
+    fn rejects_unknown_encoding() {
+        let err = Encoding::from_content_encoding(Some("br")).unwrap_err();
+        assert!(matches!(err, Error::Unsupported(s) if s == "br"));
+    }
+}
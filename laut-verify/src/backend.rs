@@ -3,13 +3,22 @@
 //! Real runs shell out via `laut_sign::nix_cmd` for nix data and dispatch
 //! by URL scheme for signatures: `http(s)://` goes over HTTP via
 //! `signature_verify::fetch_signatures_from_cache`, `file://` reads from
-//! `<path>/traces/<input_hash>` on disk. Tests inject an in-memory backend
+//! `<path>/traces/<input_hash>` on disk, or from its `.zst` / `.gz` sibling
+//! when the body was stored compressed. Tests inject an in-memory backend
 //! backed by pre-loaded fixtures so the orchestrator never touches the
 //! system `nix` binary or the network.
+//!
+//! The orchestrator asks for one topological layer at a time through the
+//! batch methods. Their defaults loop over the per-item methods; a backend
+//! with a bulk path (a bundle, a daemon, an object store) overrides them to
+//! answer a layer in one round trip. [`RealBackend`] has no bulk endpoint
+//! to call, so it fans the per-item work out over a few threads instead.
 
 use std::collections::HashMap;
 use std::fs;
-use std::path::PathBuf;
+use std::path::{Path, PathBuf};
+
+use laut_sign::trace_encoding::Encoding;
 
 #[derive(Debug, thiserror::Error)]
 pub enum Error {
@@ -27,6 +36,12 @@ pub enum Error {
         #[source]
         source: std::io::Error,
     },
+    #[error("failed to decode {path:?}: {source}")]
+    Decode {
+        path: String,
+        #[source]
+        source: laut_sign::trace_encoding::Error,
+    },
 }
 
 /// Cache URL transport. `--cache` accepts either form; tests typically use
@@ -64,6 +79,61 @@ pub trait Backend {
         cache_url: &str,
         input_hash: &str,
     ) -> Result<Option<Vec<u8>>, Error>;
+
+    /// [`Backend::derivation_aterm`] for every path in `drv_paths`, in the
+    /// same order. Results are per item so one missing ATerm only makes its
+    /// own udrv unresolvable.
+    fn derivation_aterms(&self, drv_paths: &[&str]) -> Vec<Result<String, Error>> {
+        drv_paths
+            .iter()
+            .map(|drv_path| self.derivation_aterm(drv_path))
+            .collect()
+    }
+
+    /// [`Backend::fetch_signatures`] for every hash in `input_hashes` against
+    /// one cache, in the same order. Results are per item so one failed
+    /// lookup doesn't sink the rest of the layer.
+    fn fetch_signatures_batch(
+        &self,
+        cache_url: &str,
+        input_hashes: &[&str],
+    ) -> Vec<Result<Option<Vec<u8>>, Error>> {
+        input_hashes
+            .iter()
+            .map(|input_hash| self.fetch_signatures(cache_url, input_hash))
+            .collect()
+    }
+}
+
+/// Upper bound on concurrent `nix store cat` processes or HTTP requests
+/// [`RealBackend`] issues for one batch.
+const MAX_FAN_OUT: usize = 16;
+
+/// Map `f` over `items` on up to `max_workers` scoped threads, keeping input
+/// order. Chunks are contiguous, so concatenating them in spawn order
+/// restores it.
+pub(crate) fn fan_out<T, R, F>(items: &[T], max_workers: usize, f: F) -> Vec<R>
+where
+    T: Sync,
+    R: Send,
+    F: Fn(&T) -> R + Sync,
+{
+    let workers = max_workers.min(items.len());
+    if workers <= 1 {
+        return items.iter().map(&f).collect();
+    }
+    let chunk_size = items.len().div_ceil(workers);
+    let f = &f;
+    std::thread::scope(|scope| {
+        let handles: Vec<_> = items
+            .chunks(chunk_size)
+            .map(|chunk| scope.spawn(move || chunk.iter().map(f).collect::<Vec<_>>()))
+            .collect();
+        handles
+            .into_iter()
+            .flat_map(|h| h.join().expect("fan-out worker panicked"))
+            .collect()
+    })
 }
 
 pub struct RealBackend;
@@ -95,25 +165,60 @@ impl Backend for RealBackend {
                     &base_url, input_hash,
                 )?)
             }
-            CacheTransport::File(dir) => {
-                let path = dir.join("traces").join(input_hash);
-                match fs::read(&path) {
-                    Ok(bytes) => Ok(Some(bytes)),
-                    Err(e) if e.kind() == std::io::ErrorKind::NotFound => Ok(None),
-                    Err(source) => Err(Error::Io {
-                        path: path.display().to_string(),
-                        source,
-                    }),
-                }
-            }
+            CacheTransport::File(dir) => read_trace_file(&dir.join("traces"), input_hash),
         }
     }
+
+    fn derivation_aterms(&self, drv_paths: &[&str]) -> Vec<Result<String, Error>> {
+        fan_out(drv_paths, MAX_FAN_OUT, |drv_path| {
+            self.derivation_aterm(drv_path)
+        })
+    }
+
+    fn fetch_signatures_batch(
+        &self,
+        cache_url: &str,
+        input_hashes: &[&str],
+    ) -> Vec<Result<Option<Vec<u8>>, Error>> {
+        fan_out(input_hashes, MAX_FAN_OUT, |input_hash| {
+            self.fetch_signatures(cache_url, input_hash)
+        })
+    }
+}
+
+/// Read `<traces_dir>/<input_hash>`, falling back to its compressed siblings.
+fn read_trace_file(traces_dir: &Path, input_hash: &str) -> Result<Option<Vec<u8>>, Error> {
+    for encoding in Encoding::ALL {
+        let path = traces_dir.join(format!("{}{}", input_hash, encoding.file_suffix()));
+        let file = match fs::File::open(&path) {
+            Ok(f) => f,
+            Err(e) if e.kind() == std::io::ErrorKind::NotFound => continue,
+            Err(source) => {
+                return Err(Error::Io {
+                    path: path.display().to_string(),
+                    source,
+                });
+            }
+        };
+        return encoding
+            .decode_all(file)
+            .map(Some)
+            .map_err(|source| Error::Decode {
+                path: path.display().to_string(),
+                source,
+            });
+    }
+    Ok(None)
 }
 
 /// In-memory backend used by integration tests. Pre-populated from fixture files.
 pub struct InMemoryBackend {
     pub recursive_json: String,
     pub aterms: HashMap<String, String>,
+    /// Optional store-layout directory (`<dir>/<drv basename>`) consulted when
+    /// `aterms` has no entry. Lets large-closure fixtures be read lazily, one
+    /// derivation at a time, instead of parsing one big JSON map up front.
+    pub aterm_dir: Option<PathBuf>,
     /// `input_hash -> raw signatures-file bytes` (typically `{"signatures": [...]}`)`.
     pub signatures: HashMap<String, Vec<u8>>,
 }
@@ -124,10 +229,23 @@ impl Backend for InMemoryBackend {
     }
 
     fn derivation_aterm(&self, drv_path: &str) -> Result<String, Error> {
-        self.aterms
-            .get(drv_path)
-            .cloned()
-            .ok_or_else(|| Error::MissingAtermFixture(drv_path.to_owned()))
+        if let Some(aterm) = self.aterms.get(drv_path) {
+            return Ok(aterm.clone());
+        }
+        let (Some(dir), Some(basename)) = (&self.aterm_dir, Path::new(drv_path).file_name()) else {
+            return Err(Error::MissingAtermFixture(drv_path.to_owned()));
+        };
+        let path = dir.join(basename);
+        match fs::read_to_string(&path) {
+            Ok(aterm) => Ok(aterm),
+            Err(e) if e.kind() == std::io::ErrorKind::NotFound => {
+                Err(Error::MissingAtermFixture(drv_path.to_owned()))
+            }
+            Err(source) => Err(Error::Io {
+                path: path.display().to_string(),
+                source,
+            }),
+        }
     }
 
     fn fetch_signatures(
@@ -138,3 +256,53 @@ impl Backend for InMemoryBackend {
         Ok(self.signatures.get(input_hash).cloned())
     }
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn file_backend_reads_compressed_siblings() {
+        let root = tempfile::tempdir().expect("tempdir");
+        let traces = root.path().join("traces");
+        fs::create_dir_all(&traces).unwrap();
+        let body = br#"{"signatures":["a.b.c"]}"#;
+        let cases = [
+            ("plain", Encoding::Identity),
+            ("zhash", Encoding::Zstd),
+            ("ghash", Encoding::Gzip),
+        ];
+        for (hash, encoding) in cases {
+            let name = format!("{}{}", hash, encoding.file_suffix());
+            fs::write(traces.join(name), encoding.encode(body).unwrap()).unwrap();
+        }
+        let url = format!("file://{}", root.path().display());
+        for (hash, _) in cases {
+            let got = RealBackend.fetch_signatures(&url, hash).unwrap();
+            assert_eq!(got.as_deref(), Some(&body[..]), "{}", hash);
+        }
+        assert!(RealBackend.fetch_signatures(&url, "missing").unwrap().is_none());
+    }
+
+    #[test]
+    fn fan_out_keeps_input_order() {
+        let items: Vec<usize> = (0..37).collect();
+        assert_eq!(fan_out(&items, 4, |i| i * 2), (0..37).map(|i| i * 2).collect::<Vec<_>>());
+        assert!(fan_out(&[] as &[usize], 4, |i| *i).is_empty());
+    }
+
+    #[test]
+    fn file_backend_batch_matches_per_item() {
+        let root = tempfile::tempdir().expect("tempdir");
+        let traces = root.path().join("traces");
+        fs::create_dir_all(&traces).unwrap();
+        fs::write(traces.join("present"), br#"{"signatures":[]}"#).unwrap();
+        let url = format!("file://{}", root.path().display());
+        let got = RealBackend.fetch_signatures_batch(&url, &["missing", "present", "missing"]);
+        let got: Vec<Option<Vec<u8>>> = got.into_iter().map(Result::unwrap).collect();
+        assert_eq!(
+            got,
+            vec![None, Some(br#"{"signatures":[]}"#.to_vec()), None]
+        );
+    }
+}
@@ -1,26 +1,39 @@
 //! Hash-divergence debug probe.
 //!
-//! When `collect_resolutions` computes a `ct_input_hash` and finds no signed
+//! When the orchestrator computes a `ct_input_hash` and finds no signed
 //! claims for it, the most useful question is "is there a signer-side
 //! preimage with a looser notion of identity, and how does it differ from
 //! ours?". The probe surface lets the orchestrator emit that event and
 //! plug in different lookup + diff strategies without bloating its own code.
 //!
 //! The default probe is a no-op; production builds never run this path.
-//! The active probe writes both preimages to a temp dir and shells out to
-//! `difft` for a structural diff. A bytewise check around `difft` catches
-//! the case where the structural diff is empty but the bytes do differ.
+//! [`AtermDiffProbe`] buffers misses and, once the walk is done, diffs them
+//! in parallel against the corpus with an in-process field-level ATerm diff
+//! (see [`aterm_diff`]). [`DifftProbe`] is the opt-in fallback: it writes
+//! both preimages to a temp dir and shells out to `difft` for a structural
+//! diff. A bytewise check around `difft` catches the case where the
+//! structural diff is empty but the bytes do differ.
 
 use std::collections::HashMap;
 use std::fs;
+use std::io::Write;
 use std::path::{Path, PathBuf};
 use std::process::Command;
+use std::sync::Mutex;
 
 use serde_json::Value;
 
 use base64::Engine as _;
 use base64::engine::general_purpose::URL_SAFE_NO_PAD;
 
+use laut_sign::trace_encoding::{self, Encoding};
+
+use crate::backend::fan_out;
+
+mod aterm_diff;
+
+pub use aterm_diff::{diff_aterms, rank_candidates, AtermDiff, FieldDelta};
+
 /// A looser identity than `ct_input_hash`. Used to find signer-side preimages
 /// when the exact-hash lookup misses.
 #[derive(Debug, Clone, Copy, PartialEq, Eq, Hash)]
@@ -50,6 +63,10 @@ pub struct PreimageCandidate {
 
 pub trait DebugProbe {
     fn on_signature_miss(&self, local: &LocalWitness<'_>);
+
+    /// Called once the orchestrator has finished walking the graph. Probes
+    /// that batch their work report here; the default does nothing.
+    fn finish(&self) {}
 }
 
 /// Default. Drops events. Compile-time identical to "no probe wired".
@@ -120,10 +137,16 @@ pub enum CorpusError {
         source: std::io::Error,
     },
     #[error("failed to read trace file {path:?}: {source}")]
-    FileRead {
+    FileDecode {
         path: String,
         #[source]
-        source: std::io::Error,
+        source: trace_encoding::Error,
+    },
+    #[error("failed to decode response body from {url:?}: {source}")]
+    Decode {
+        url: String,
+        #[source]
+        source: trace_encoding::Error,
     },
 }
 
@@ -175,10 +198,14 @@ fn build_from_dir(traces_dir: &std::path::Path) -> Result<InMemoryCorpusIndex, C
         if !path.is_file() {
             continue;
         }
-        let body = std::fs::read(&path).map_err(|source| CorpusError::FileRead {
-            path: path.display().to_string(),
-            source,
-        })?;
+        let encoding = Encoding::from_file_name(&entry.file_name().to_string_lossy());
+        let body = std::fs::File::open(&path)
+            .map_err(trace_encoding::Error::from)
+            .and_then(|f| encoding.decode_all(f))
+            .map_err(|source| CorpusError::FileDecode {
+                path: path.display().to_string(),
+                source,
+            })?;
         extract_into(&mut index, &body);
     }
     Ok(index)
@@ -252,12 +279,21 @@ fn fetch_listing(url: &str) -> Result<Vec<String>, CorpusError> {
     }
 }
 
+/// GET one trace body, negotiating compression and decoding it as it streams.
 fn fetch_bytes(url: &str) -> Result<Vec<u8>, CorpusError> {
-    let resp = ureq::get(url).call().map_err(|e| CorpusError::Transport {
-        url: url.to_owned(),
-        source: e,
-    })?;
-    read_body(url, resp)
+    let resp = ureq::get(url)
+        .set("Accept-Encoding", trace_encoding::ACCEPT_ENCODING)
+        .call()
+        .map_err(|e| CorpusError::Transport {
+            url: url.to_owned(),
+            source: e,
+        })?;
+    Encoding::from_content_encoding(resp.header("Content-Encoding"))
+        .and_then(|encoding| encoding.decode_all(resp.into_reader()))
+        .map_err(|source| CorpusError::Decode {
+            url: url.to_owned(),
+            source,
+        })
 }
 
 fn read_body(url: &str, resp: ureq::Response) -> Result<Vec<u8>, CorpusError> {
@@ -288,9 +324,152 @@ pub fn extract_debug_from_jws(jws: &str) -> Option<(String, String, String)> {
     Some((drv_name, drv_path, aterm))
 }
 
-/// The active probe. Renders one bytewise + structural diff per candidate
-/// the index returns, writing both preimages to `out_dir` so the operator
-/// can re-run `difft` themselves.
+/// Number of ranked candidates whose full field-level delta is printed per
+/// miss. The rest only contribute to the summary line.
+const RENDERED_CANDIDATES: usize = 3;
+
+/// Owned copy of a [`LocalWitness`], buffered until [`DebugProbe::finish`].
+struct PendingMiss {
+    udrv_drv_path: String,
+    udrv_name: String,
+    ct_input_hash: String,
+    aterm_bytes: String,
+}
+
+/// The default active probe. Collects misses during the walk, then diffs
+/// each one against every candidate the index returns using the built-in
+/// ATerm diff, spread over all available cores. Only a ranked, compact
+/// field-level delta is printed; nothing is written to disk.
+pub struct AtermDiffProbe {
+    index: InMemoryCorpusIndex,
+    pending: Mutex<Vec<PendingMiss>>,
+    sink: Mutex<Box<dyn Write + Send>>,
+}
+
+impl AtermDiffProbe {
+    /// Reports go to stderr.
+    pub fn new(index: InMemoryCorpusIndex) -> Self {
+        Self::with_sink(index, Box::new(std::io::stderr()))
+    }
+
+    /// Reports go to `sink`, one block per miss in the order the misses
+    /// were hit.
+    pub fn with_sink(index: InMemoryCorpusIndex, sink: Box<dyn Write + Send>) -> Self {
+        Self {
+            index,
+            pending: Mutex::new(Vec::new()),
+            sink: Mutex::new(sink),
+        }
+    }
+
+    fn report(&self, miss: &PendingMiss) -> String {
+        use std::fmt::Write as _;
+        let mut out = String::new();
+        let candidates = self.index.lookup(Identity::DrvName, &miss.udrv_name);
+        if candidates.is_empty() {
+            let _ = writeln!(
+                out,
+                "[laut debug] no signed preimage candidates for drv_name {:?} (local ct_input_hash {})",
+                miss.udrv_name, miss.ct_input_hash
+            );
+            return out;
+        }
+
+        let mut ranked = rank_candidates(
+            &miss.aterm_bytes,
+            candidates.iter().map(|c| c.aterm_preimage.as_str()),
+        );
+        // A candidate signed for the very resolved drv path we computed is
+        // the direct counterpart of this miss, whatever its score. The sort
+        // is stable, so similarity order is kept within each group.
+        ranked.sort_by_key(|(i, _)| {
+            laut_sign::store_path::extract_store_hash(&candidates[*i].drv_path).ok().as_deref()
+                != Some(miss.ct_input_hash.as_str())
+        });
+        let _ = writeln!(
+            out,
+            "[laut debug] {} candidate(s) for drv_name {:?} at {} (local ct_input_hash {})",
+            candidates.len(),
+            miss.udrv_name,
+            miss.udrv_drv_path,
+            miss.ct_input_hash
+        );
+        for (i, diff) in ranked.iter().take(RENDERED_CANDIDATES) {
+            let candidate = &candidates[*i];
+            if diff.deltas.is_empty() {
+                let _ = writeln!(
+                    out,
+                    "[laut debug]   {} — identical to local preimage (divergence is elsewhere)",
+                    candidate.drv_path
+                );
+                continue;
+            }
+            let kind = if diff.structural {
+                "field(s) differ"
+            } else {
+                "unparseable, textual delta"
+            };
+            let _ = writeln!(
+                out,
+                "[laut debug]   {} — {} {}",
+                candidate.drv_path,
+                diff.deltas.len(),
+                kind
+            );
+            out.push_str(&diff.render("[laut debug]     "));
+        }
+        if ranked.len() > RENDERED_CANDIDATES {
+            let _ = writeln!(
+                out,
+                "[laut debug]   ... {} less similar candidate(s) omitted",
+                ranked.len() - RENDERED_CANDIDATES
+            );
+        }
+        out
+    }
+}
+
+impl DebugProbe for AtermDiffProbe {
+    fn on_signature_miss(&self, local: &LocalWitness<'_>) {
+        let mut pending = self.pending.lock().unwrap_or_else(|e| e.into_inner());
+        pending.push(PendingMiss {
+            udrv_drv_path: local.udrv_drv_path.to_owned(),
+            udrv_name: local.udrv_name.to_owned(),
+            ct_input_hash: local.ct_input_hash.to_owned(),
+            aterm_bytes: local.aterm_bytes.to_owned(),
+        });
+    }
+
+    fn finish(&self) {
+        let misses = {
+            let mut pending = self.pending.lock().unwrap_or_else(|e| e.into_inner());
+            std::mem::take(&mut *pending)
+        };
+        if misses.is_empty() {
+            return;
+        }
+        let workers = std::thread::available_parallelism()
+            .map(|n| n.get())
+            .unwrap_or(1);
+        let reports = fan_out(&misses, workers, |m| self.report(m));
+        let mut sink = self.sink.lock().unwrap_or_else(|e| e.into_inner());
+        for report in reports {
+            let _ = sink.write_all(report.as_bytes());
+        }
+        let _ = sink.flush();
+    }
+}
+
+impl Drop for AtermDiffProbe {
+    /// Don't lose buffered misses when the orchestrator bails out early.
+    fn drop(&mut self) {
+        self.finish();
+    }
+}
+
+/// The `difft` fallback probe. Renders one bytewise + structural diff per
+/// candidate the index returns, writing both preimages to `out_dir` so the
+/// operator can re-run `difft` themselves.
 pub struct DifftProbe {
     index: InMemoryCorpusIndex,
     out_dir: PathBuf,
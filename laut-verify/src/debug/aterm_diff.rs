@@ -0,0 +1,353 @@
+//! In-process, field-level ATerm diff for [`super::AtermDiffProbe`].
+//!
+//! Both preimages are parsed with snix's non-validating parser and compared
+//! field by field (outputs, input derivations, input sources, system,
+//! builder, args, env). The number of differing entries doubles as a
+//! similarity score for ranking candidates. If either side does not parse,
+//! we fall back to a single textual delta around the first divergence, so a
+//! trailing garbage byte still shows up.
+
+use std::collections::{BTreeMap, BTreeSet};
+use std::fmt::Write as _;
+
+use nix_compat::derivation::Derivation;
+
+/// Characters of unchanged context to keep on each side of a divergence.
+const CONTEXT: usize = 24;
+/// Maximum characters of differing text shown per side before eliding.
+const MAX_DIVERGENT: usize = 120;
+
+/// One differing entry. `local`/`candidate` are `None` when the entry is
+/// missing on that side.
+#[derive(Debug, Clone, PartialEq, Eq)]
+pub struct FieldDelta {
+    /// ATerm field name, e.g. `env` or `inputSrcs`.
+    pub field: &'static str,
+    /// Entry within the field (env var name, output name, arg index). Empty
+    /// for scalar fields and set-valued fields.
+    pub key: String,
+    pub local: Option<String>,
+    pub candidate: Option<String>,
+}
+
+/// Result of comparing a local preimage against one candidate.
+#[derive(Debug, Clone)]
+pub struct AtermDiff {
+    pub deltas: Vec<FieldDelta>,
+    /// `false` when at least one side failed to parse and `deltas` holds the
+    /// textual fallback instead of field-level entries.
+    pub structural: bool,
+}
+
+impl AtermDiff {
+    /// Lower is more similar. Unparseable candidates sort after every
+    /// parseable one.
+    pub fn score(&self) -> usize {
+        if self.structural {
+            self.deltas.len()
+        } else {
+            usize::MAX
+        }
+    }
+
+    /// Render the deltas as indented lines, one per entry.
+    pub fn render(&self, indent: &str) -> String {
+        let mut out = String::new();
+        for d in &self.deltas {
+            let label = if d.key.is_empty() {
+                d.field.to_owned()
+            } else {
+                format!("{}[{}]", d.field, d.key)
+            };
+            let _ = match (&d.local, &d.candidate) {
+                (Some(l), Some(c)) => {
+                    let (l, c) = elide_pair(l, c);
+                    writeln!(out, "{}{}: {:?} -> {:?}", indent, label, l, c)
+                }
+                (Some(l), None) => writeln!(out, "{}{}: - {:?}", indent, label, elide(l)),
+                (None, Some(c)) => writeln!(out, "{}{}: + {:?}", indent, label, elide(c)),
+                (None, None) => Ok(()),
+            };
+        }
+        out
+    }
+}
+
+/// Compare two ATerm preimages. `local` is what the verifier computed,
+/// `candidate` what a signer embedded in its debug block.
+pub fn diff_aterms(local: &str, candidate: &str) -> AtermDiff {
+    let parsed_local = Derivation::from_aterm_bytes_unchecked(local.as_bytes()).ok();
+    diff_against(local, parsed_local.as_ref(), candidate)
+}
+
+/// [`diff_aterms`] with `local` already parsed (`None` if it doesn't parse),
+/// so ranking many candidates parses the local preimage only once.
+fn diff_against(local: &str, parsed_local: Option<&Derivation>, candidate: &str) -> AtermDiff {
+    let parsed_candidate = Derivation::from_aterm_bytes_unchecked(candidate.as_bytes());
+    let (Some(l), Ok(c)) = (parsed_local, parsed_candidate) else {
+        return AtermDiff {
+            deltas: vec![text_delta(local, candidate)],
+            structural: false,
+        };
+    };
+
+    let mut deltas = Vec::new();
+    diff_maps(
+        &mut deltas,
+        "outputs",
+        &l.outputs
+            .iter()
+            .map(|(k, v)| (k.clone(), format!("{:?}", v)))
+            .collect(),
+        &c.outputs
+            .iter()
+            .map(|(k, v)| (k.clone(), format!("{:?}", v)))
+            .collect(),
+    );
+    diff_maps(&mut deltas, "inputDrvs", &input_drvs(l), &input_drvs(&c));
+    diff_sets(
+        &mut deltas,
+        "inputSrcs",
+        &l.input_sources
+            .iter()
+            .map(|p| p.to_absolute_path())
+            .collect(),
+        &c.input_sources
+            .iter()
+            .map(|p| p.to_absolute_path())
+            .collect(),
+    );
+    diff_scalar(&mut deltas, "system", &l.system, &c.system);
+    diff_scalar(&mut deltas, "builder", &l.builder, &c.builder);
+    diff_maps(
+        &mut deltas,
+        "args",
+        &indexed(&l.arguments),
+        &indexed(&c.arguments),
+    );
+    diff_maps(
+        &mut deltas,
+        "env",
+        &l.environment
+            .iter()
+            .map(|(k, v)| (k.clone(), lossy(v)))
+            .collect(),
+        &c.environment
+            .iter()
+            .map(|(k, v)| (k.clone(), lossy(v)))
+            .collect(),
+    );
+    if deltas.is_empty() && local != candidate {
+        // Same fields, different bytes: escaping, whitespace or trailing
+        // data the parser tolerated. Surface the raw divergence instead of
+        // claiming the preimages match.
+        deltas.push(text_delta(local, candidate));
+    }
+    AtermDiff {
+        deltas,
+        structural: true,
+    }
+}
+
+/// Diff `local` against every candidate and return `(candidate_index, diff)`
+/// pairs, most similar first. Ties keep corpus order.
+pub fn rank_candidates<'a, I>(local: &str, candidates: I) -> Vec<(usize, AtermDiff)>
+where
+    I: IntoIterator<Item = &'a str>,
+{
+    let parsed_local = Derivation::from_aterm_bytes_unchecked(local.as_bytes()).ok();
+    let mut ranked: Vec<(usize, AtermDiff)> = candidates
+        .into_iter()
+        .enumerate()
+        .map(|(i, c)| (i, diff_against(local, parsed_local.as_ref(), c)))
+        .collect();
+    ranked.sort_by_key(|(_, d)| d.score());
+    ranked
+}
+
+fn text_delta(local: &str, candidate: &str) -> FieldDelta {
+    FieldDelta {
+        field: "aterm",
+        key: String::new(),
+        local: Some(local.to_owned()),
+        candidate: Some(candidate.to_owned()),
+    }
+}
+
+fn input_drvs(drv: &Derivation) -> BTreeMap<String, String> {
+    drv.input_derivations
+        .iter()
+        .map(|(path, outputs)| {
+            let outputs: Vec<&str> = outputs.iter().map(String::as_str).collect();
+            (path.to_absolute_path(), outputs.join(","))
+        })
+        .collect()
+}
+
+fn indexed(args: &[String]) -> BTreeMap<String, String> {
+    args.iter()
+        .enumerate()
+        .map(|(i, a)| (format!("{:03}", i), a.clone()))
+        .collect()
+}
+
+fn lossy<T: AsRef<[u8]> + ?Sized>(v: &T) -> String {
+    String::from_utf8_lossy(v.as_ref()).into_owned()
+}
+
+fn diff_scalar(out: &mut Vec<FieldDelta>, field: &'static str, l: &str, c: &str) {
+    if l != c {
+        out.push(FieldDelta {
+            field,
+            key: String::new(),
+            local: Some(l.to_owned()),
+            candidate: Some(c.to_owned()),
+        });
+    }
+}
+
+fn diff_sets(
+    out: &mut Vec<FieldDelta>,
+    field: &'static str,
+    l: &BTreeSet<String>,
+    c: &BTreeSet<String>,
+) {
+    for removed in l.difference(c) {
+        out.push(FieldDelta {
+            field,
+            key: String::new(),
+            local: Some(removed.clone()),
+            candidate: None,
+        });
+    }
+    for added in c.difference(l) {
+        out.push(FieldDelta {
+            field,
+            key: String::new(),
+            local: None,
+            candidate: Some(added.clone()),
+        });
+    }
+}
+
+fn diff_maps(
+    out: &mut Vec<FieldDelta>,
+    field: &'static str,
+    l: &BTreeMap<String, String>,
+    c: &BTreeMap<String, String>,
+) {
+    let keys: BTreeSet<&String> = l.keys().chain(c.keys()).collect();
+    for key in keys {
+        let (lv, cv) = (l.get(key), c.get(key));
+        if lv != cv {
+            out.push(FieldDelta {
+                field,
+                key: key.clone(),
+                local: lv.cloned(),
+                candidate: cv.cloned(),
+            });
+        }
+    }
+}
+
+/// Trim a one-sided value to `MAX_DIVERGENT` characters.
+fn elide(s: &str) -> String {
+    if s.chars().count() <= MAX_DIVERGENT {
+        return s.to_owned();
+    }
+    let head: String = s.chars().take(MAX_DIVERGENT).collect();
+    format!("{}…", head)
+}
+
+/// Cut both values down to the region around their first divergence, with
+/// `CONTEXT` characters of shared text on either side.
+fn elide_pair(l: &str, c: &str) -> (String, String) {
+    let l_chars: Vec<char> = l.chars().collect();
+    let c_chars: Vec<char> = c.chars().collect();
+    let prefix = l_chars
+        .iter()
+        .zip(&c_chars)
+        .take_while(|(a, b)| a == b)
+        .count();
+    let max_suffix = l_chars.len().min(c_chars.len()) - prefix;
+    let suffix = l_chars
+        .iter()
+        .rev()
+        .zip(c_chars.iter().rev())
+        .take(max_suffix)
+        .take_while(|(a, b)| a == b)
+        .count();
+    (
+        window(&l_chars, prefix, suffix),
+        window(&c_chars, prefix, suffix),
+    )
+}
+
+fn window(chars: &[char], prefix: usize, suffix: usize) -> String {
+    let start = prefix.saturating_sub(CONTEXT);
+    let divergent_end = chars.len() - suffix;
+    let end = (divergent_end + CONTEXT).min(chars.len());
+    let mut out = String::new();
+    if start > 0 {
+        out.push('…');
+    }
+    if divergent_end - prefix > MAX_DIVERGENT {
+        out.extend(&chars[start..prefix + MAX_DIVERGENT]);
+        out.push('…');
+        out.extend(&chars[divergent_end..end]);
+    } else {
+        out.extend(&chars[start..end]);
+    }
+    if end < chars.len() {
+        out.push('…');
+    }
+    out
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    const BASE: &str = r#"Derive([("out","/nix/store/0c7b4mzw1crqhzfwywxnp9s4gyng1qcl-demo","","")],[],["/nix/store/1n6pjfv7a9vmpvjw4iqxq2cz7g5b1zda-src"],"x86_64-linux","/bin/sh",["-c","echo hi"],[("name","demo"),("out","/nix/store/0c7b4mzw1crqhzfwywxnp9s4gyng1qcl-demo"),("system","x86_64-linux")])"#;
+
+    #[test]
+    fn identical_preimages_have_no_deltas() {
+        let d = diff_aterms(BASE, BASE);
+        assert!(d.structural);
+        assert!(d.deltas.is_empty());
+        assert_eq!(d.score(), 0);
+    }
+
+    #[test]
+    fn env_and_args_changes_are_reported_per_entry() {
+        let other = BASE
+            .replace(r#""echo hi""#, r#""echo bye""#)
+            .replace(r#"("name","demo")"#, r#"("name","demo2")"#);
+        let d = diff_aterms(BASE, &other);
+        assert!(d.structural);
+        assert_eq!(d.deltas.len(), 2);
+        assert!(d.deltas.iter().any(|x| x.field == "args" && x.key == "001"));
+        assert!(d.deltas.iter().any(|x| x.field == "env" && x.key == "name"));
+    }
+
+    #[test]
+    fn unparseable_candidate_falls_back_to_text_and_ranks_last() {
+        let close = BASE.replace(r#""echo hi""#, r#""echo bye""#);
+        let broken = format!("{}MARKER", &BASE[..40]);
+        let ranked = rank_candidates(BASE, [broken.as_str(), close.as_str()]);
+        assert_eq!(ranked[0].0, 1);
+        assert_eq!(ranked[1].0, 0);
+        assert!(!ranked[1].1.structural);
+        assert!(ranked[1].1.render("").contains("MARKER"));
+    }
+
+    #[test]
+    fn elide_pair_keeps_divergence_and_context() {
+        let l = format!("{}AAA{}", "x".repeat(100), "y".repeat(100));
+        let c = format!("{}BBB{}", "x".repeat(100), "y".repeat(100));
+        let (le, ce) = elide_pair(&l, &c);
+        assert!(le.contains("AAA") && ce.contains("BBB"));
+        assert!(le.starts_with('…') && le.ends_with('…'));
+        assert!(le.chars().count() < l.chars().count());
+    }
+}
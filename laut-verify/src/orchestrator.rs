@@ -1,12 +1,15 @@
 //! End-to-end verification orchestrator.
 //!
-//! One DFS over the derivation graph: each udrv visit builds its
-//! `UnresolvedDerivation` (via [`tree`]), feeds the verifier's facts and walks
-//! the cartesian product of its deps' resolutions (via [`resolutions`]), and
-//! returns the set of plausible resolutions for that udrv. Memo on drv_path
-//! ensures each udrv is processed once even when it sits under multiple
-//! parents. Resolution-hash → ATerm computation and signature fetching live in
-//! [`compute`]; success/failure rendering lives in [`report`].
+//! Two phases. First a walk over the derivation graph builds every
+//! `UnresolvedDerivation` (via [`tree`]), memoized on drv_path so each udrv
+//! is built once even when it sits under multiple parents. Then [`plan`]
+//! sorts those udrvs into topological layers and resolves one layer at a
+//! time: one ATerm batch, the resolved input hash of every combo in the
+//! cartesian product of each udrv's dep resolutions, one signature lookup
+//! per cache, and one verification pass. [`resolutions`] turns the results
+//! into verifier facts and each udrv's set of plausible resolutions.
+//! Resolution-hash computation and signature fetching live in [`compute`];
+//! success/failure rendering lives in [`report`].
 
 use std::collections::HashMap;
 use std::sync::Arc;
@@ -24,6 +27,7 @@ use crate::types::{TrustlesslyResolvedDerivation, UnresolvedDerivation};
 use crate::verifier::{Facts, Subset, TrustModel, Verifier, VerifyResult};
 
 mod compute;
+mod plan;
 mod report;
 mod resolutions;
 mod tree;
@@ -66,8 +70,9 @@ pub struct Config {
     /// `(key_name, raw_32_byte_public_key)` for each trusted key.
     pub trusted_keys: Vec<(String, Vec<u8>)>,
     pub allow_ia: bool,
-    /// Defaults to a `NullProbe`; the verify CLI swaps in a `DifftProbe` when
-    /// `--debug-preimage-corpus` is set.
+    /// Defaults to a `NullProbe`; the verify CLI swaps in an `AtermDiffProbe`
+    /// (or a `DifftProbe` with `--debug-difft`) when `--debug-preimage-corpus`
+    /// is set.
     pub debug_probe: Box<dyn DebugProbe>,
 }
 
@@ -105,6 +110,12 @@ pub struct Orchestrator<B: Backend> {
     /// `input_hash -> fetched-and-verified (payload, kid)` pairs. Caches a
     /// network + crypto cost across resolution combinations.
     sig_memo: HashMap<String, Vec<(Value, String)>>,
+    /// `drv_path -> error` for udrvs whose own ATerm load or resolution
+    /// failed.
+    resolution_errors: HashMap<String, Error>,
+    /// `drv_path -> drv_path` of the failed udrv (itself or a dep) whose
+    /// entry in `resolution_errors` made it unresolvable.
+    failed_on: HashMap<String, String>,
 }
 
 impl<B: Backend> Orchestrator<B> {
@@ -152,6 +163,8 @@ impl<B: Backend> Orchestrator<B> {
             tree_memo: HashMap::new(),
             resolutions_memo: HashMap::new(),
             sig_memo: HashMap::new(),
+            resolution_errors: HashMap::new(),
+            failed_on: HashMap::new(),
         })
     }
 
@@ -164,8 +177,9 @@ impl<B: Backend> Orchestrator<B> {
             .udrv_str(self.expected_root)
             .map(str::to_owned)
             .expect("expected_root interned at construction");
-        let root_udrv = self.build_unresolved(&root_drv_path)?;
-        let _ = self.collect_resolutions(&root_udrv)?;
+        self.build_unresolved(&root_drv_path)?;
+        self.resolve_layers(&root_drv_path)?;
+        self.debug_probe.finish();
 
         let candidates = collect_candidate_output_maps(&self.facts, self.expected_root);
         if candidates.is_empty() {
@@ -1,5 +1,5 @@
-//! Resolved-input-hash computation and the signature-fetch/verify plumbing
-//! that feeds [`super::resolutions::collect_resolutions`].
+//! Resolved-input-hash computation and the batched signature-fetch/verify
+//! plumbing that feeds [`super::plan`].
 
 use std::collections::{BTreeMap, HashMap};
 
@@ -7,106 +7,120 @@ use serde_json::Value;
 
 use laut_sign::{constructive_trace, store_path};
 
-use crate::backend::Backend;
+use crate::backend::{fan_out, Backend};
 use crate::signature_verify;
 use crate::types::{TrustlesslyResolvedDerivation, UnresolvedDerivation};
 
 use super::{Error, Orchestrator};
 
-impl<B: Backend> Orchestrator<B> {
-    /// Returns `(ct_input_hash, aterm_bytes_string)` for `udrv` under the given
-    /// resolution. `combo` is empty for FODs / leaves.
-    pub(super) fn compute_resolved(
-        &self,
-        udrv: &UnresolvedDerivation,
-        combo: &BTreeMap<String, TrustlesslyResolvedDerivation>,
-    ) -> Result<(String, String), Error> {
-        let str_resolutions = build_string_resolutions(combo);
-        let aterm = self.backend.derivation_aterm(&udrv.drv_path)?;
-        let (resolved_drv_path, aterm_bytes) = constructive_trace::compute_resolved_input_hash(
-            &udrv.name,
-            aterm.as_bytes(),
-            &str_resolutions,
-        )
-        .map_err(|e| Error::ConstructiveTrace(format!("{}", e)))?;
-        let ct_input_hash = store_path::extract_store_hash(&resolved_drv_path)?;
-        Ok((ct_input_hash, aterm_bytes))
-    }
+/// One dependency assignment for a udrv, resolved against its ATerm.
+pub(super) struct ResolvedCombo {
+    /// `dep_drv_path -> chosen resolution`; empty for FODs / leaves.
+    pub combo: BTreeMap<String, TrustlesslyResolvedDerivation>,
+    pub ct_input_hash: String,
+    pub resolved_drv_path: String,
+    pub aterm_bytes: String,
+}
 
-    /// Same as `compute_resolved` but returns just the resolved drv path
-    /// (used to populate `TrustlesslyResolvedDerivation.drv_path`).
-    pub(super) fn compute_resolved_drv_path(
-        &self,
-        udrv: &UnresolvedDerivation,
-        combo: &BTreeMap<String, TrustlesslyResolvedDerivation>,
-    ) -> Result<String, Error> {
-        let str_resolutions = build_string_resolutions(combo);
-        let aterm = self.backend.derivation_aterm(&udrv.drv_path)?;
-        let (resolved_drv_path, _aterm_bytes) = constructive_trace::compute_resolved_input_hash(
-            &udrv.name,
-            aterm.as_bytes(),
-            &str_resolutions,
-        )
-        .map_err(|e| Error::ConstructiveTrace(format!("{}", e)))?;
-        Ok(resolved_drv_path)
-    }
+/// Resolve `udrv` (whose ATerm is `aterm`) under `combo`.
+pub(super) fn compute_resolved(
+    udrv: &UnresolvedDerivation,
+    aterm: &str,
+    combo: &BTreeMap<String, TrustlesslyResolvedDerivation>,
+) -> Result<ResolvedCombo, Error> {
+    let str_resolutions = build_string_resolutions(combo);
+    let (resolved_drv_path, aterm_bytes) = constructive_trace::compute_resolved_input_hash(
+        &udrv.name,
+        aterm.as_bytes(),
+        &str_resolutions,
+    )
+    .map_err(|e| Error::ConstructiveTrace(format!("{}", e)))?;
+    let ct_input_hash = store_path::extract_store_hash(&resolved_drv_path)?;
+    Ok(ResolvedCombo {
+        combo: combo.clone(),
+        ct_input_hash,
+        resolved_drv_path,
+        aterm_bytes,
+    })
+}
 
+impl<B: Backend> Orchestrator<B> {
+    /// Fill `sig_memo` for every hash in `input_hashes` it doesn't have yet:
+    /// one batched lookup per cache, then every returned JWS verified
+    /// together, spread over the available cores.
     pub(super) fn fetch_and_verify_signatures(
         &mut self,
-        input_hash: &str,
-    ) -> Result<Vec<(Value, String)>, Error> {
-        if let Some(cached) = self.sig_memo.get(input_hash) {
-            return Ok(cached.clone());
+        input_hashes: &[&str],
+    ) -> Result<(), Error> {
+        let missing: Vec<&str> = input_hashes
+            .iter()
+            .copied()
+            .filter(|h| !self.sig_memo.contains_key(*h))
+            .collect();
+        if missing.is_empty() {
+            return Ok(());
+        }
+        let raw = self.fetch_raw_signatures(&missing);
+        let workers = std::thread::available_parallelism()
+            .map(|n| n.get())
+            .unwrap_or(1);
+        let trusted_keys = &self.trusted_keys;
+        let verified = fan_out(&raw, workers, |(input_hash, signatures)| {
+            verify_signatures(input_hash, signatures, trusted_keys)
+        });
+        for ((input_hash, _), valid) in raw.iter().zip(verified) {
+            self.sig_memo.insert((*input_hash).to_owned(), valid?);
         }
-        let raw = self.fetch_raw_signatures(input_hash)?;
-        let valid = self.verify_signatures(input_hash, &raw)?;
-        self.sig_memo.insert(input_hash.to_owned(), valid.clone());
-        Ok(valid)
+        Ok(())
     }
 
-    fn fetch_raw_signatures(&self, input_hash: &str) -> Result<Vec<String>, Error> {
-        let mut all = Vec::new();
+    /// `(input_hash, signatures)` for each of `input_hashes`, pooled across
+    /// caches. A cache that errors or returns an unparseable body counts as a
+    /// miss for that hash.
+    fn fetch_raw_signatures<'h>(&self, input_hashes: &[&'h str]) -> Vec<(&'h str, Vec<String>)> {
+        let mut all: Vec<(&str, Vec<String>)> =
+            input_hashes.iter().map(|h| (*h, Vec::new())).collect();
         for cache_url in &self.cache_urls {
-            let body = match self.backend.fetch_signatures(cache_url, input_hash) {
-                Ok(Some(b)) => b,
-                Ok(None) => continue,
-                Err(_) => continue,
-            };
-            let parsed: Value = match serde_json::from_slice(&body) {
-                Ok(v) => v,
-                Err(_) => continue,
-            };
-            if let Some(sigs) = parsed.get("signatures").and_then(|v| v.as_array()) {
-                for s in sigs {
-                    if let Some(s) = s.as_str() {
-                        all.push(s.to_owned());
+            let bodies = self.backend.fetch_signatures_batch(cache_url, input_hashes);
+            for ((_, sigs_out), body) in all.iter_mut().zip(bodies) {
+                let body = match body {
+                    Ok(Some(b)) => b,
+                    Ok(None) => continue,
+                    Err(_) => continue,
+                };
+                let parsed: Value = match serde_json::from_slice(&body) {
+                    Ok(v) => v,
+                    Err(_) => continue,
+                };
+                if let Some(sigs) = parsed.get("signatures").and_then(|v| v.as_array()) {
+                    for s in sigs {
+                        if let Some(s) = s.as_str() {
+                            sigs_out.push(s.to_owned());
+                        }
                     }
                 }
             }
         }
-        Ok(all)
+        all
     }
+}
 
-    fn verify_signatures(
-        &self,
-        input_hash: &str,
-        signatures: &[String],
-    ) -> Result<Vec<(Value, String)>, Error> {
-        let results = signature_verify::verify_resolved_trace_signatures(
-            input_hash,
-            signatures,
-            &self.trusted_keys,
-        )?;
-        let mut out = Vec::new();
-        for (payload_str, kid) in results {
-            let payload: Value = match serde_json::from_str(&payload_str) {
-                Ok(v) => v,
-                Err(_) => continue,
-            };
-            out.push((payload, kid));
-        }
-        Ok(out)
+fn verify_signatures(
+    input_hash: &str,
+    signatures: &[String],
+    trusted_keys: &[(String, Vec<u8>)],
+) -> Result<Vec<(Value, String)>, Error> {
+    let results =
+        signature_verify::verify_resolved_trace_signatures(input_hash, signatures, trusted_keys)?;
+    let mut out = Vec::new();
+    for (payload_str, kid) in results {
+        let payload: Value = match serde_json::from_str(&payload_str) {
+            Ok(v) => v,
+            Err(_) => continue,
+        };
+        out.push((payload, kid));
     }
+    Ok(out)
 }
 
 /// Flatten a resolution map into the `dep_drv_path -> {output_name -> content_hash}`
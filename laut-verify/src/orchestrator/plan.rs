@@ -0,0 +1,203 @@
+//! Level-synchronous planning: sort the udrv graph in `tree_memo` into
+//! topological layers, then resolve a whole layer at a time so each backend
+//! call covers every udrv in it instead of one node.
+
+use std::collections::{BTreeMap, BTreeSet, HashMap};
+use std::sync::Arc;
+
+use crate::backend::Backend;
+use crate::types::{TrustlesslyResolvedDerivation, UnresolvedDerivation};
+
+use super::compute::{compute_resolved, ResolvedCombo};
+use super::resolutions::cartesian_product;
+use super::{Error, Orchestrator};
+
+impl<B: Backend> Orchestrator<B> {
+    /// Group every udrv in `tree_memo` by depth. Layer 0 holds FODs and
+    /// derivations without inputs; a udrv lands one layer above its deepest
+    /// input, so all of its deps are resolved by the time its layer runs.
+    /// Layers are sorted by drv_path to keep runs deterministic.
+    pub(super) fn plan_layers(&self) -> Vec<Vec<Arc<UnresolvedDerivation>>> {
+        let mut depths: HashMap<String, usize> = HashMap::with_capacity(self.tree_memo.len());
+        let mut layers: Vec<Vec<Arc<UnresolvedDerivation>>> = Vec::new();
+        for udrv in self.tree_memo.values() {
+            let depth = layer_of(udrv, &mut depths);
+            if layers.len() <= depth {
+                layers.resize_with(depth + 1, Vec::new);
+            }
+            layers[depth].push(udrv.clone());
+        }
+        for layer in &mut layers {
+            layer.sort_by(|a, b| a.drv_path.cmp(&b.drv_path));
+        }
+        layers
+    }
+
+    /// Resolve every udrv in `tree_memo`, bottom layer first. An ATerm or
+    /// compute error only fails the run if it reaches `root_drv_path` through
+    /// deps that otherwise all resolve, as it did in the depth-first walk.
+    pub(super) fn resolve_layers(&mut self, root_drv_path: &str) -> Result<(), Error> {
+        for layer in self.plan_layers() {
+            self.resolve_layer(&layer)?;
+        }
+        if let Some(origin) = self.failed_on.get(root_drv_path).cloned() {
+            return Err(self
+                .resolution_errors
+                .remove(&origin)
+                .expect("failed_on only points at recorded errors"));
+        }
+        Ok(())
+    }
+
+    /// One layer: a single ATerm batch, every resolved input hash for every
+    /// surviving combo, one signature lookup per cache, then one verification
+    /// pass over everything that came back.
+    fn resolve_layer(&mut self, layer: &[Arc<UnresolvedDerivation>]) -> Result<(), Error> {
+        let mut pending: Vec<(Arc<UnresolvedDerivation>, Vec<Combo>)> = Vec::new();
+        for udrv in layer {
+            if self.resolutions_memo.contains_key(&udrv.drv_path) {
+                continue;
+            }
+            if udrv.is_fixed_output {
+                pending.push((udrv.clone(), vec![BTreeMap::new()]));
+                continue;
+            }
+            // If any dep can't be resolved, this udrv is unresolvable; skip it
+            // before paying for its ATerm. A dep that failed with an error
+            // only passes that error on if no other dep is plainly
+            // unresolvable, which the old walk would have stopped at.
+            let mut dep_resolutions = Vec::with_capacity(udrv.inputs.len());
+            let mut unresolvable = false;
+            let mut failed_dep: Option<String> = None;
+            for input in &udrv.inputs {
+                let dep_path = &input.derivation.drv_path;
+                let child = self
+                    .resolutions_memo
+                    .get(dep_path)
+                    .cloned()
+                    .unwrap_or_default();
+                if !child.is_empty() {
+                    dep_resolutions.push((input.derivation.clone(), child));
+                } else if let Some(origin) = self.failed_on.get(dep_path) {
+                    failed_dep.get_or_insert_with(|| origin.clone());
+                } else {
+                    unresolvable = true;
+                    break;
+                }
+            }
+            if !unresolvable && failed_dep.is_none() {
+                pending.push((udrv.clone(), cartesian_product(&dep_resolutions)));
+                continue;
+            }
+            if let (false, Some(origin)) = (unresolvable, failed_dep) {
+                self.failed_on.insert(udrv.drv_path.clone(), origin);
+            }
+            self.resolutions_memo
+                .insert(udrv.drv_path.clone(), Vec::new());
+        }
+        if pending.is_empty() {
+            return Ok(());
+        }
+
+        let drv_paths: Vec<&str> = pending.iter().map(|(u, _)| u.drv_path.as_str()).collect();
+        let aterms = self.backend.derivation_aterms(&drv_paths);
+
+        // The layer holds udrvs the root may only reach through a dep that is
+        // unresolvable anyway, so a udrv whose ATerm can't be loaded or
+        // resolved keeps its error to itself rather than failing the layer.
+        let mut resolved: Vec<(Arc<UnresolvedDerivation>, Vec<ResolvedCombo>)> =
+            Vec::with_capacity(pending.len());
+        for ((udrv, combos), aterm) in pending.into_iter().zip(aterms) {
+            let rows = aterm.map_err(Error::from).and_then(|aterm| {
+                combos
+                    .iter()
+                    .map(|combo| compute_resolved(&udrv, &aterm, combo))
+                    .collect::<Result<Vec<_>, _>>()
+            });
+            match rows {
+                Ok(rows) => resolved.push((udrv, rows)),
+                Err(e) => {
+                    self.resolution_errors.insert(udrv.drv_path.clone(), e);
+                    self.failed_on
+                        .insert(udrv.drv_path.clone(), udrv.drv_path.clone());
+                    self.resolutions_memo
+                        .insert(udrv.drv_path.clone(), Vec::new());
+                }
+            }
+        }
+
+        // FODs are trusted by output path; they never need signatures.
+        let lookups: BTreeSet<&str> = resolved
+            .iter()
+            .filter(|(udrv, _)| !udrv.is_fixed_output)
+            .flat_map(|(_, rows)| rows.iter().map(|r| r.ct_input_hash.as_str()))
+            .collect();
+        let lookups: Vec<&str> = lookups.into_iter().collect();
+        self.fetch_and_verify_signatures(&lookups)?;
+
+        for (udrv, rows) in resolved {
+            if udrv.is_fixed_output {
+                self.record_fod(&udrv, &rows[0].ct_input_hash)?;
+            } else {
+                self.record_resolutions(&udrv, rows);
+            }
+        }
+        Ok(())
+    }
+}
+
+type Combo = BTreeMap<String, TrustlesslyResolvedDerivation>;
+
+fn layer_of(udrv: &UnresolvedDerivation, depths: &mut HashMap<String, usize>) -> usize {
+    if let Some(&depth) = depths.get(&udrv.drv_path) {
+        return depth;
+    }
+    let depth = udrv
+        .inputs
+        .iter()
+        .map(|input| layer_of(&input.derivation, depths) + 1)
+        .max()
+        .unwrap_or(0);
+    depths.insert(udrv.drv_path.clone(), depth);
+    depth
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::types::UnresolvedReferencedInputs;
+
+    fn node(path: &str, deps: &[&Arc<UnresolvedDerivation>]) -> Arc<UnresolvedDerivation> {
+        Arc::new(UnresolvedDerivation {
+            drv_path: path.into(),
+            name: path.into(),
+            input_hash: path.into(),
+            outputs: BTreeMap::new(),
+            inputs: deps
+                .iter()
+                .map(|d| UnresolvedReferencedInputs {
+                    derivation: (*d).clone(),
+                    inputs: BTreeMap::new(),
+                })
+                .collect(),
+            is_fixed_output: false,
+            is_content_addressed: true,
+            fod_out_path: None,
+        })
+    }
+
+    #[test]
+    fn layer_is_one_above_deepest_input() {
+        // d needs a and c, c needs a and b, b needs a: d lands above the
+        // longest chain, not the shortest.
+        let a = node("a", &[]);
+        let b = node("b", &[&a]);
+        let c = node("c", &[&a, &b]);
+        let d = node("d", &[&a, &c]);
+        let mut depths = HashMap::new();
+        assert_eq!(layer_of(&d, &mut depths), 3);
+        assert_eq!(depths["a"], 0);
+        assert_eq!(depths["b"], 1);
+        assert_eq!(depths["c"], 2);
+    }
+}
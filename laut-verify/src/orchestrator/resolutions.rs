@@ -1,6 +1,6 @@
-//! Resolution collection: for each udrv, enumerate the cartesian product over
-//! its deps' plausible resolutions, fetch signatures for each candidate, and
-//! feed the resulting facts into the verifier.
+//! Resolution recording: turn a udrv's resolved combos and their verified
+//! signatures (computed a layer at a time by [`super::plan`]) into verifier
+//! facts and the udrv's set of plausible resolutions.
 
 use std::collections::{BTreeMap, HashMap, HashSet};
 use std::sync::Arc;
@@ -10,70 +10,71 @@ use crate::debug::LocalWitness;
 use crate::string_interner::{ContentHash, OutputName, UDrv};
 use crate::types::{TrustlesslyResolvedDerivation, UnresolvedDerivation, UnresolvedOutput};
 
+use super::compute::ResolvedCombo;
 use super::{Error, Orchestrator};
 
 impl<B: Backend> Orchestrator<B> {
-    pub(super) fn collect_resolutions(
+    /// Record a FOD's single resolution. FODs are trusted by output path, so
+    /// no signatures are involved.
+    pub(super) fn record_fod(
         &mut self,
         udrv: &Arc<UnresolvedDerivation>,
-    ) -> Result<Vec<TrustlesslyResolvedDerivation>, Error> {
-        if let Some(existing) = self.resolutions_memo.get(&udrv.drv_path) {
-            return Ok(existing.clone());
-        }
-
-        if udrv.is_fixed_output {
-            let fod_out_path = udrv.fod_out_path.as_deref().ok_or_else(|| {
-                Error::FodMissingOut {
-                    drv_path: udrv.drv_path.clone(),
-                }
-            })?;
-            let (ct_input_hash, _aterm_bytes) = self.compute_resolved(udrv, &BTreeMap::new())?;
-            self.add_fod_to_facts(udrv, fod_out_path);
-            let out_output = udrv.outputs.get("out").cloned().ok_or_else(|| {
-                Error::UnknownReferencedOutput {
-                    drv_path: udrv.drv_path.clone(),
-                    output_name: "out".to_owned(),
-                }
-            })?;
-            let mut outs = BTreeMap::new();
-            outs.insert(out_output, fod_out_path.to_owned());
-            let resolved = TrustlesslyResolvedDerivation {
-                resolves: udrv.clone(),
-                drv_path: None,
-                input_hash: ct_input_hash,
-                outputs: outs,
-            };
-            let result = vec![resolved];
-            self.resolutions_memo
-                .insert(udrv.drv_path.clone(), result.clone());
-            return Ok(result);
-        }
-
-        // Recurse first; if any dep can't be resolved, this udrv is unresolvable.
-        let mut dep_resolutions: Vec<(Arc<UnresolvedDerivation>, Vec<TrustlesslyResolvedDerivation>)> =
-            Vec::with_capacity(udrv.inputs.len());
-        for input in &udrv.inputs {
-            let child = self.collect_resolutions(&input.derivation)?;
-            if child.is_empty() {
-                self.resolutions_memo
-                    .insert(udrv.drv_path.clone(), Vec::new());
-                return Ok(Vec::new());
+        ct_input_hash: &str,
+    ) -> Result<(), Error> {
+        let fod_out_path = udrv.fod_out_path.as_deref().ok_or_else(|| {
+            Error::FodMissingOut {
+                drv_path: udrv.drv_path.clone(),
             }
-            dep_resolutions.push((input.derivation.clone(), child));
-        }
+        })?;
+        self.add_fod_to_facts(udrv, fod_out_path);
+        let out_output = udrv.outputs.get("out").cloned().ok_or_else(|| {
+            Error::UnknownReferencedOutput {
+                drv_path: udrv.drv_path.clone(),
+                output_name: "out".to_owned(),
+            }
+        })?;
+        let mut outs = BTreeMap::new();
+        outs.insert(out_output, fod_out_path.to_owned());
+        let resolved = TrustlesslyResolvedDerivation {
+            resolves: udrv.clone(),
+            drv_path: None,
+            input_hash: ct_input_hash.to_owned(),
+            outputs: outs,
+        };
+        self.resolutions_memo
+            .insert(udrv.drv_path.clone(), vec![resolved]);
+        Ok(())
+    }
 
+    /// Feed the verifier's facts for every resolved combo of `udrv` and
+    /// record its plausible resolutions. Signatures for every
+    /// `ct_input_hash` in `rows` must already be in `sig_memo`.
+    pub(super) fn record_resolutions(
+        &mut self,
+        udrv: &Arc<UnresolvedDerivation>,
+        rows: Vec<ResolvedCombo>,
+    ) {
         self.add_unresolved_to_facts(udrv);
 
         let mut plausible: Vec<TrustlesslyResolvedDerivation> = Vec::new();
         let mut seen_resolution_hashes: HashSet<String> = HashSet::new();
-        for combo in cartesian_product(&dep_resolutions) {
-            let (ct_input_hash, aterm_bytes) = self.compute_resolved(udrv, &combo)?;
+        for row in rows {
+            let ResolvedCombo {
+                combo,
+                ct_input_hash,
+                resolved_drv_path,
+                aterm_bytes,
+            } = row;
             // Avoid pushing the same `(udrv, ct_input_hash, output_map)` twice
             // when distinct dep choices happen to collapse to the same resolved
             // input hash (rare but possible).
             self.add_resolved_to_facts(udrv, &ct_input_hash, &combo);
 
-            let signatures = self.fetch_and_verify_signatures(&ct_input_hash)?;
+            let signatures = self
+                .sig_memo
+                .get(&ct_input_hash)
+                .cloned()
+                .unwrap_or_default();
             if signatures.is_empty() {
                 self.debug_probe.on_signature_miss(&LocalWitness {
                     udrv_drv_path: &udrv.drv_path,
@@ -128,19 +129,16 @@ impl<B: Backend> Orchestrator<B> {
                     // skip this signer's identical copy.
                     continue;
                 }
-                let resolved_drv_path = self.compute_resolved_drv_path(udrv, &combo)?;
                 plausible.push(TrustlesslyResolvedDerivation {
                     resolves: udrv.clone(),
-                    drv_path: Some(resolved_drv_path),
+                    drv_path: Some(resolved_drv_path.clone()),
                     input_hash: ct_input_hash.clone(),
                     outputs,
                 });
             }
         }
 
-        self.resolutions_memo
-            .insert(udrv.drv_path.clone(), plausible.clone());
-        Ok(plausible)
+        self.resolutions_memo.insert(udrv.drv_path.clone(), plausible);
     }
 
     fn add_fod_to_facts(&mut self, udrv: &UnresolvedDerivation, out_path: &str) {
@@ -4,7 +4,7 @@ use base64::Engine as _;
 use base64::engine::general_purpose::URL_SAFE_NO_PAD;
 use ed25519_dalek::{Signature, VerifyingKey};
 use laut_sign::thumbprint::{self, ed25519_thumbprint};
-use std::io::Read;
+use laut_sign::trace_encoding::{self, Encoding};
 
 #[derive(Debug, thiserror::Error)]
 pub enum Error {
@@ -26,18 +26,24 @@ pub enum Error {
     Io(#[from] std::io::Error),
     #[error("{0}")]
     Thumbprint(#[from] thumbprint::Error),
+    #[error("{0}")]
+    Encoding(#[from] trace_encoding::Error),
 }
 
+/// GET `<base_url>/traces/<input_hash>`, advertising every supported
+/// encoding and decoding the body per the response's `Content-Encoding`.
 pub fn fetch_signatures_from_cache(
     base_url: &str,
     input_hash: &str,
 ) -> Result<Option<Vec<u8>>, Error> {
     let url = format!("{}/traces/{}", base_url.trim_end_matches('/'), input_hash);
-    match ureq::get(&url).call() {
+    match ureq::get(&url)
+        .set("Accept-Encoding", trace_encoding::ACCEPT_ENCODING)
+        .call()
+    {
         Ok(resp) => {
-            let mut buf = Vec::new();
-            resp.into_reader().read_to_end(&mut buf)?;
-            Ok(Some(buf))
+            let encoding = Encoding::from_content_encoding(resp.header("Content-Encoding"))?;
+            Ok(Some(encoding.decode_all(resp.into_reader())?))
         }
         Err(ureq::Error::Status(404, _)) => Ok(None),
         Err(e) => Err(Error::Http(format!("{}", e))),
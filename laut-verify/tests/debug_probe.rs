@@ -5,13 +5,17 @@
 //! production code path (cache URL → corpus) gets exercised end-to-end.
 
 use std::fs;
+use std::io::Write;
 use std::path::PathBuf;
 use std::process::Command;
+use std::sync::{Arc, Mutex};
 
 use laut_verify::debug::{
-    build_corpus_from_cache, extract_debug_from_jws, DebugProbe, DifftProbe, Identity,
-    InMemoryCorpusIndex, LocalWitness, NullProbe, PreimageCandidate,
+    build_corpus_from_cache, extract_debug_from_jws, rank_candidates, AtermDiffProbe,
+    DebugProbe, DifftProbe, Identity, InMemoryCorpusIndex, LocalWitness, NullProbe,
+    PreimageCandidate,
 };
+use laut_sign::trace_encoding::Encoding;
 
 fn data_dir() -> PathBuf {
     PathBuf::from(env!("CARGO_MANIFEST_DIR"))
@@ -75,6 +79,37 @@ fn corpus_contains_known_fixture_drv_names() {
     }
 }
 
+#[test]
+fn corpus_built_from_compressed_file_cache_matches_plain() {
+    // Same fixtures, stored the way a cache fed by compressing signers
+    // looks on disk: alternating `.zst` and `.gz` bodies.
+    let root = tempfile::tempdir().expect("tempdir");
+    let traces = root.path().join("traces");
+    fs::create_dir_all(&traces).unwrap();
+    for (i, entry) in fs::read_dir(signatures_dir()).unwrap().enumerate() {
+        let path = entry.unwrap().path();
+        let encoding = if i % 2 == 0 { Encoding::Zstd } else { Encoding::Gzip };
+        let name = format!(
+            "{}{}",
+            path.file_name().unwrap().to_str().unwrap(),
+            encoding.file_suffix()
+        );
+        let body = encoding.encode(&fs::read(&path).unwrap()).unwrap();
+        fs::write(traces.join(name), body).unwrap();
+    }
+    let index = build_corpus_from_cache(&fixture_cache_url(&root)).expect("corpus build");
+    let plain_root = fixture_cache_root();
+    let plain = build_corpus_from_cache(&fixture_cache_url(&plain_root)).expect("corpus build");
+    for name in &["xz-5.8.1", "hello-2.12.1", "zlib-1.3.1"] {
+        assert_eq!(
+            index.lookup(Identity::DrvName, name).len(),
+            plain.lookup(Identity::DrvName, name).len(),
+            "compressed corpus disagrees with plain corpus for {:?}",
+            name
+        );
+    }
+}
+
 #[test]
 fn corpus_lookup_misses_for_unknown_name() {
     let root = fixture_cache_root();
@@ -230,6 +265,99 @@ fn difft_probe_runs_difft_on_bytewise_differs() {
     );
 }
 
+// ---------------- Built-in ATerm diff ----------------
+
+#[test]
+fn rank_candidates_puts_single_env_change_first_on_fixture_preimage() {
+    let root = fixture_cache_root();
+    let index = build_corpus_from_cache(&fixture_cache_url(&root)).expect("corpus build");
+    let real = &index.lookup(Identity::DrvName, "hello-2.12.1")[0].aterm_preimage;
+    assert!(real.contains("(\"name\",\"hello-2.12.1\")"));
+    let local = real.replace(
+        "(\"name\",\"hello-2.12.1\")",
+        "(\"name\",\"hello-2.12.1-local\")",
+    );
+    let truncated = format!("{}LAUT_TRUNCATED", &real[..real.len() / 2]);
+
+    let ranked = rank_candidates(&local, [truncated.as_str(), real.as_str()]);
+    let (best, diff) = &ranked[0];
+    assert_eq!(*best, 1, "parseable candidate should outrank the truncated one");
+    assert!(diff.structural);
+    assert_eq!(diff.deltas.len(), 1, "got {:?}", diff.deltas);
+    assert_eq!(diff.deltas[0].field, "env");
+    assert_eq!(diff.deltas[0].key, "name");
+
+    let (_, fallback) = &ranked[1];
+    assert!(!fallback.structural);
+    assert!(fallback.render("").contains("LAUT_TRUNCATED"));
+}
+
+/// `Write` into a buffer the test keeps a handle to.
+#[derive(Clone, Default)]
+struct SharedSink(Arc<Mutex<Vec<u8>>>);
+
+impl Write for SharedSink {
+    fn write(&mut self, buf: &[u8]) -> std::io::Result<usize> {
+        self.0.lock().unwrap().extend_from_slice(buf);
+        Ok(buf.len())
+    }
+
+    fn flush(&mut self) -> std::io::Result<()> {
+        Ok(())
+    }
+}
+
+#[test]
+fn aterm_diff_probe_reports_buffered_misses_in_order_on_finish() {
+    let mut index = InMemoryCorpusIndex::new();
+    index.add(
+        "demo".to_owned(),
+        PreimageCandidate {
+            drv_path: "/nix/store/aaa-demo.drv".to_owned(),
+            aterm_preimage: "Derive(signer-side)".to_owned(),
+        },
+    );
+    let sink = SharedSink::default();
+    let probe = AtermDiffProbe::with_sink(index, Box::new(sink.clone()));
+    let misses = ["ct1", "ct2", "ct3", "ct4", "ct5", "ct6", "ct7", "ct8", "ct9"];
+    for ct in misses {
+        probe.on_signature_miss(&LocalWitness {
+            udrv_drv_path: "/nix/store/bbb-demo.drv",
+            udrv_name: "demo",
+            udrv_input_hash: "h",
+            ct_input_hash: ct,
+            aterm_bytes: "Derive(local)",
+        });
+    }
+    assert!(sink.0.lock().unwrap().is_empty(), "nothing reported before finish");
+
+    // Unparseable preimages on both sides exercise the textual fallback
+    // across the worker threads.
+    probe.finish();
+    let report = String::from_utf8(sink.0.lock().unwrap().clone()).unwrap();
+    let headers: Vec<&str> = report
+        .lines()
+        .filter(|l| l.starts_with("[laut debug] 1 candidate(s)"))
+        .collect();
+    assert_eq!(headers.len(), misses.len(), "report:\n{}", report);
+    for (header, ct) in headers.iter().zip(misses) {
+        assert!(
+            header.ends_with(&format!("(local ct_input_hash {})", ct)),
+            "out of order: {:?}",
+            header
+        );
+    }
+    assert_eq!(
+        report.matches("/nix/store/aaa-demo.drv — 1 unparseable, textual delta").count(),
+        misses.len()
+    );
+    assert!(report.contains("Derive(signer-side)"));
+
+    // Everything was drained; a second call reports nothing more.
+    probe.finish();
+    assert_eq!(sink.0.lock().unwrap().len(), report.len());
+}
+
 // ---------------- extract_debug_from_jws ----------------
 
 #[test]
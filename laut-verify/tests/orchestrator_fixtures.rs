@@ -4,17 +4,19 @@
 //! tests used). Tests load them, pre-populate an `InMemoryBackend`, and walk
 //! the orchestrator without touching the system `nix` or the network.
 
+use std::cell::Cell;
 use std::collections::HashMap;
 use std::fs;
 use std::path::PathBuf;
 
 use ed25519_dalek::SigningKey;
-use laut_verify::backend::InMemoryBackend;
+use laut_verify::backend::{self, Backend, InMemoryBackend};
 use laut_verify::keyfiles;
 use laut_verify::orchestrator::{cartesian_product, Config, Error, Orchestrator};
 use laut_verify::types::{TrustlesslyResolvedDerivation, UnresolvedDerivation};
 
 use std::collections::BTreeMap;
+use std::rc::Rc;
 use std::sync::Arc;
 
 /// `<repo-root>/tests/data`. We resolve relative to `CARGO_MANIFEST_DIR`
@@ -66,6 +68,7 @@ fn ca_backend() -> InMemoryBackend {
     InMemoryBackend {
         recursive_json: read_recursive("hello-ca-recursive-unresolved.drv"),
         aterms: read_aterms("hello-ca-recursive-unresolved-aterm.json"),
+        aterm_dir: None,
         signatures: read_all_signatures(),
     }
 }
@@ -74,6 +77,7 @@ fn ia_backend() -> InMemoryBackend {
     InMemoryBackend {
         recursive_json: read_recursive("hello-ia-recursive-unresolved.drv"),
         aterms: HashMap::new(),
+        aterm_dir: None,
         signatures: HashMap::new(),
     }
 }
@@ -125,8 +129,8 @@ fn ia_drv_tree_rejected_when_allow_ia_false() {
 #[test]
 fn ia_drv_tree_accepted_when_allow_ia_true() {
     // Just confirm tree-walking doesn't error; ATerm fixtures aren't present
-    // for the IA tree so we expect a backend error once `compute_resolved`
-    // tries to look one up. The Python test only checked that
+    // for the IA tree so we expect a backend error once the first layer's
+    // ATerm batch tries to look them up. The Python test only checked that
     // `build_unresolved_tree` returned without raising.
     let mut orch = make_orchestrator(
         ia_backend(),
@@ -187,6 +191,149 @@ fn verify_ca_drv_large_returns_one_resolution() {
     assert_eq!(verified.len(), 1);
 }
 
+#[test]
+fn verify_ca_drv_small_with_lazy_aterm_dir() {
+    // Same fixture as above, but laid out one `.drv` file per derivation
+    // (what `generate_test_data_with_aterm.py --aterm-dir` writes) and read
+    // lazily by the backend instead of from the pre-loaded map.
+    let dir = tempfile::tempdir().expect("tempdir");
+    for (drv_path, aterm) in read_aterms("hello-ca-recursive-unresolved-aterm.json") {
+        let basename = PathBuf::from(&drv_path).file_name().unwrap().to_owned();
+        fs::write(dir.path().join(basename), aterm).expect("write aterm file");
+    }
+    let backend = InMemoryBackend {
+        recursive_json: read_recursive("hello-ca-recursive-unresolved.drv"),
+        aterms: HashMap::new(),
+        aterm_dir: Some(dir.path().to_path_buf()),
+        signatures: read_all_signatures(),
+    };
+    let mut orch = make_orchestrator(
+        backend,
+        "/nix/store/cjpxbf5h30808h53lckfyvzacsvfs08q-bootstrap-stage1-stdenv-linux.drv",
+        false,
+    )
+    .expect("orchestrator construction");
+    let verified = orch.verify().expect("verify");
+    assert_eq!(verified.len(), 1, "expected exactly one verified candidate");
+}
+
+#[test]
+fn verify_ca_drv_small_missing_aterm_surfaces_backend_error() {
+    // One of the root's direct inputs has no ATerm while every other dep
+    // resolves, so the root depends on the failure and verify reports the
+    // backend error rather than "no candidates".
+    let mut backend = ca_backend();
+    backend
+        .aterms
+        .remove("/nix/store/wcdz70g62qvnpwsqp54j2phfmccghdq2-update-autotools-gnu-config-scripts-hook.drv")
+        .expect("fixture has the ATerm");
+    let mut orch = make_orchestrator(
+        backend,
+        "/nix/store/cjpxbf5h30808h53lckfyvzacsvfs08q-bootstrap-stage1-stdenv-linux.drv",
+        false,
+    )
+    .expect("orchestrator construction");
+    let result = orch.verify();
+    assert!(
+        matches!(
+            result,
+            Err(Error::Backend(backend::Error::MissingAtermFixture(ref p)))
+                if p.ends_with("update-autotools-gnu-config-scripts-hook.drv")
+        ),
+        "expected MissingAtermFixture, got {:?}",
+        result
+    );
+}
+
+/// Call counts recorded by [`CountingBackend`], shared with the test.
+#[derive(Default)]
+struct BackendCalls {
+    single_aterm: Cell<usize>,
+    single_signature: Cell<usize>,
+    aterm_batches: Cell<usize>,
+    aterms_requested: Cell<usize>,
+    signature_batches: Cell<usize>,
+}
+
+fn bump(counter: &Cell<usize>, by: usize) {
+    counter.set(counter.get() + by);
+}
+
+/// Forwards to an `InMemoryBackend` and counts calls, to check that the
+/// orchestrator asks for whole layers rather than single derivations.
+struct CountingBackend {
+    inner: InMemoryBackend,
+    calls: Rc<BackendCalls>,
+}
+
+impl Backend for CountingBackend {
+    fn derivation_show_recursive(&self, drv_path: &str) -> Result<String, backend::Error> {
+        self.inner.derivation_show_recursive(drv_path)
+    }
+
+    fn derivation_aterm(&self, drv_path: &str) -> Result<String, backend::Error> {
+        bump(&self.calls.single_aterm, 1);
+        self.inner.derivation_aterm(drv_path)
+    }
+
+    fn fetch_signatures(
+        &self,
+        cache_url: &str,
+        input_hash: &str,
+    ) -> Result<Option<Vec<u8>>, backend::Error> {
+        bump(&self.calls.single_signature, 1);
+        self.inner.fetch_signatures(cache_url, input_hash)
+    }
+
+    fn derivation_aterms(&self, drv_paths: &[&str]) -> Vec<Result<String, backend::Error>> {
+        bump(&self.calls.aterm_batches, 1);
+        bump(&self.calls.aterms_requested, drv_paths.len());
+        self.inner.derivation_aterms(drv_paths)
+    }
+
+    fn fetch_signatures_batch(
+        &self,
+        cache_url: &str,
+        input_hashes: &[&str],
+    ) -> Vec<Result<Option<Vec<u8>>, backend::Error>> {
+        bump(&self.calls.signature_batches, 1);
+        self.inner.fetch_signatures_batch(cache_url, input_hashes)
+    }
+}
+
+#[test]
+fn verify_ca_drv_large_batches_backend_calls_per_layer() {
+    let calls = Rc::new(BackendCalls::default());
+    let backend = CountingBackend {
+        inner: ca_backend(),
+        calls: calls.clone(),
+    };
+    let mut orch = Orchestrator::new(
+        backend,
+        Config {
+            root_drv_path: "/nix/store/yvixdlqwq3l5ikd0b5c3f39pxmfynwhl-hello-2.12.1.drv"
+                .to_owned(),
+            cache_urls: vec!["http://mock".to_owned()],
+            trusted_keys: trusted_keys(),
+            ..Default::default()
+        },
+    )
+    .expect("orchestrator construction");
+    let verified = orch.verify().expect("verify");
+    assert_eq!(verified.len(), 1);
+
+    // The hello closure has 250 udrvs whose longest input chain is 55 deep,
+    // so 56 layers. Every udrv resolves, so each one's ATerm is requested
+    // exactly once, one batch per layer. Layer 0 is all FODs, which need
+    // no signatures; every other layer needs one lookup for the one cache.
+    assert_eq!(calls.aterm_batches.get(), 56);
+    assert_eq!(calls.aterms_requested.get(), 250);
+    assert_eq!(calls.signature_batches.get(), 55);
+    // The per-item entry points are never called directly.
+    assert_eq!(calls.single_aterm.get(), 0);
+    assert_eq!(calls.single_signature.get(), 0);
+}
+
 // ---------------- cartesian_product (test_generate_combinations) equivalents ----------------
 
 fn mk_dep(path: &str) -> Arc<UnresolvedDerivation> {
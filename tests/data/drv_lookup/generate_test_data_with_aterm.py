@@ -6,16 +6,39 @@ This script reads the output of `nix derivation show --recursive` from stdin,
 and generates two files:
 1. The original JSON data (pass-through)
 2. A JSON file mapping derivation paths to their ATerm representations
+
+ATerms are read straight from the `.drv` files in the local store, using a
+pool of worker threads. Only derivations that cannot be read from disk (for
+example because the store is not mounted at `/nix/store`) fall back to
+`nix store cat`. The ATerm map is written out entry by entry as results come
+in, so large closures never have to be held in memory twice.
+
+With `--aterm-dir DIR` the script additionally writes every ATerm to
+`DIR/<basename>.drv`, mirroring the store layout. `InMemoryBackend` can load
+such a directory lazily via its `aterm_dir` field, reading only the
+derivations a test actually touches.
 """
 
+import argparse
 import json
+import os
 import subprocess
 import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 
 def get_derivation_aterm(drv_path):
-    """Get the ATerm representation of a derivation using nix store cat."""
+    """Get the ATerm representation of a derivation.
+
+    Reads the `.drv` file directly and falls back to `nix store cat` if that
+    is not possible.
+    """
+    try:
+        return Path(drv_path).read_text(encoding='utf-8')
+    except OSError:
+        pass
     result = subprocess.run(
         ['nix', '--extra-experimental-features', 'nix-command', 'store', 'cat', drv_path],
         capture_output=True,
@@ -25,44 +48,94 @@ def get_derivation_aterm(drv_path):
     return result.stdout
 
 
+def fetch(drv_path):
+    """Worker entry point: returns `(drv_path, aterm_or_None, error_or_None)`."""
+    try:
+        return drv_path, get_derivation_aterm(drv_path), None
+    except (OSError, subprocess.SubprocessError, UnicodeDecodeError) as e:
+        return drv_path, None, e
+
+
+def write_aterms(drv_paths, output_aterm_file, aterm_dir, jobs):
+    """Fetch ATerms in parallel and stream them into `output_aterm_file`.
+
+    `executor.map` yields results in input order, so the output is
+    deterministic regardless of which worker finishes first. The map is
+    streamed into a temporary file next to `output_aterm_file` and only moved
+    into place once complete, so a crash leaves the previous fixture intact.
+    """
+    if aterm_dir is not None:
+        os.makedirs(aterm_dir, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(output_aterm_file)),
+        prefix=os.path.basename(output_aterm_file) + '.',
+        suffix='.tmp',
+    )
+    try:
+        written = _stream_aterms(drv_paths, fd, aterm_dir, jobs)
+        # mkstemp creates the file 0600; keep the fixture's usual mode.
+        try:
+            mode = os.stat(output_aterm_file).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, output_aterm_file)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return written
+
+
+def _stream_aterms(drv_paths, fd, aterm_dir, jobs):
+    written = 0
+    with os.fdopen(fd, 'w') as f, ThreadPoolExecutor(max_workers=jobs) as executor:
+        f.write('{')
+        for i, (drv_path, aterm, error) in enumerate(executor.map(fetch, drv_paths), 1):
+            print(f"Processing {i}/{len(drv_paths)}: {drv_path}", file=sys.stderr)
+            if error is not None:
+                print(f"Warning: Failed to get ATerm for {drv_path}: {error}", file=sys.stderr)
+                # Continue processing other derivations
+                continue
+            f.write(',\n  ' if written else '\n  ')
+            f.write(f"{json.dumps(drv_path)}: {json.dumps(aterm)}")
+            written += 1
+            if aterm_dir is not None:
+                with open(os.path.join(aterm_dir, os.path.basename(drv_path)), 'w', encoding='utf-8') as drv_file:
+                    drv_file.write(aterm)
+        f.write('\n}' if written else '}')
+    return written
+
+
 def main():
-    if len(sys.argv) != 3:
-        print(f"Usage: {sys.argv[0]} <output-json-file> <output-aterm-json-file>", file=sys.stderr)
-        print("Reads nix derivation show JSON from stdin", file=sys.stderr)
-        sys.exit(1)
-    
-    output_json_file = sys.argv[1]
-    output_aterm_file = sys.argv[2]
-    
+    parser = argparse.ArgumentParser(
+        description='Reads nix derivation show JSON from stdin and writes JSON and ATerm fixtures'
+    )
+    parser.add_argument('output_json_file', help='Where to write the pass-through derivation JSON')
+    parser.add_argument('output_aterm_file', help='Where to write the drv_path -> ATerm JSON map')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 4,
+                        help='Number of parallel workers (default: number of CPUs)')
+    parser.add_argument('--aterm-dir', default=None,
+                        help='Also write one <basename>.drv file per derivation into this directory')
+    args = parser.parse_args()
+
     # Read JSON from stdin
     print("Reading derivation data from stdin...", file=sys.stderr)
     derivations = json.load(sys.stdin)
-    
+
     print(f"Found {len(derivations)} derivations", file=sys.stderr)
-    
+
     # Save the original JSON data
-    with open(output_json_file, 'w') as f:
+    with open(args.output_json_file, 'w') as f:
         json.dump(derivations, f, indent=2)
-    print(f"Saved JSON data to {output_json_file}", file=sys.stderr)
-    
-    # Create a mapping of derivation paths to their ATerm representations
-    aterm_data = {}
-    
-    for i, drv_path in enumerate(derivations.keys(), 1):
-        print(f"Processing {i}/{len(derivations)}: {drv_path}", file=sys.stderr)
-        try:
-            aterm = get_derivation_aterm(drv_path)
-            aterm_data[drv_path] = aterm
-        except subprocess.CalledProcessError as e:
-            print(f"Warning: Failed to get ATerm for {drv_path}: {e}", file=sys.stderr)
-            # Continue processing other derivations
-    
-    # Save ATerm data to JSON file
-    with open(output_aterm_file, 'w') as f:
-        json.dump(aterm_data, f, indent=2)
-    
-    print(f"Saved ATerm data for {len(aterm_data)} derivations to {output_aterm_file}", file=sys.stderr)
+    print(f"Saved JSON data to {args.output_json_file}", file=sys.stderr)
+
+    written = write_aterms(list(derivations.keys()), args.output_aterm_file, args.aterm_dir, args.jobs)
+
+    print(f"Saved ATerm data for {written} derivations to {args.output_aterm_file}", file=sys.stderr)
+    if args.aterm_dir is not None:
+        print(f"Wrote per-derivation ATerm files to {args.aterm_dir}", file=sys.stderr)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -2,8 +2,9 @@
 
 Tampers one trace's signed-preimage so the verifier's expected hash no longer
 has a valid signature, then runs verify with --debug-preimage-corpus pointed
-at the same on-disk cache. The probe should fire and difft should surface
-the tamper marker we injected.
+at the same on-disk cache. The probe should fire and surface the tamper
+marker we injected, first through the built-in ATerm diff and then through
+the `--debug-difft` fallback.
 """
 
 # Verifier only — no HTTP cache. We use file:// throughout.
@@ -27,15 +28,15 @@ print(f"tamper output:\n{tamper_output}")
 
 # Run verify pointing at the on-disk cache. We expect failure (the tampered
 # signature is invalid for the hash it lives under) and probe activation.
-debug_cmd = (
+verify_cmd = (
     f"laut verify "
     f"--cache 'file:///var/lib/cache' "
     f"--trusted-key {builderA_pub} --trusted-key {builderB_pub} "
     f"--debug-preimage-corpus 'file:///var/lib/cache' "
-    f"--debug-out-dir /tmp/laut-debug "
-    f"$(nix-instantiate '<nixpkgs-ca>' -A {packageToBuild}) 2>&1"
 )
-debug_output = verifier.fail(debug_cmd)
+target = f"$(nix-instantiate '<nixpkgs-ca>' -A {packageToBuild})"
+
+debug_output = verifier.fail(f"{verify_cmd} {target} 2>&1")
 print(f"laut verify --debug-preimage-corpus output:\n{debug_output}")
 
 assert "[laut debug]" in debug_output, (
@@ -43,6 +44,19 @@ assert "[laut debug]" in debug_output, (
     "contain '[laut debug]'"
 )
 assert TAMPER_MARKER in debug_output, (
+    "expected the built-in ATerm diff to surface the tamper marker "
+    f"{TAMPER_MARKER!r} but it was absent from stderr — corpus building or "
+    "candidate ranking must have failed"
+)
+# The built-in diff never writes artifacts.
+verifier.succeed("test ! -e /tmp/laut-debug")
+
+difft_output = verifier.fail(
+    f"{verify_cmd} --debug-difft --debug-out-dir /tmp/laut-debug {target} 2>&1"
+)
+print(f"laut verify --debug-difft output:\n{difft_output}")
+
+assert TAMPER_MARKER in difft_output, (
     f"expected difft output to surface the tamper marker {TAMPER_MARKER!r} "
     "but it was absent from stderr — corpus building or difft invocation "
     "must have failed"
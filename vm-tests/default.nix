@@ -80,8 +80,9 @@ in
     # Exercises the hash-divergence debug probe end-to-end: reuses the
     # small-sign cache (preimages on), tampers one trace's preimage with a
     # known marker on the verifier, then runs `laut verify
-    # --debug-preimage-corpus file://...` and asserts difft surfaces the
-    # marker. Single instance — the probe doesn't benefit from scale variants.
+    # --debug-preimage-corpus file://...` and asserts both the built-in
+    # ATerm diff and the `--debug-difft` fallback surface the marker.
+    # Single instance — the probe doesn't benefit from scale variants.
     #
     # The verifierExtraConfig injects just-this-test-needs-it tooling:
     # difftastic for the structural diff, and a writePython3Bin-wrapped
@@ -1,8 +1,50 @@
 #!/usr/bin/env python3
+"""Reference HTTP cache for laut: static GET, conditional PUT, and a JSON
+listing of `/traces/`.
+
+Defaults match the VM tests (`/var/lib/cache`, port 9000). `load-test.py`
+runs it locally with `--root`/`--port` and the fault-injection knobs
+(`--latency`, `--jitter`, `--error-rate`).
+"""
+import argparse
+import gzip
 import hashlib
 import json
 import os
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+import random
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# Content-Encoding -> on-disk suffix. A PUT with `Content-Encoding: zstd`
+# is stored as `<path>.zst`, and so on. Exactly one variant of a path
+# exists at a time.
+ENCODING_SUFFIXES = {'identity': '', 'zstd': '.zst', 'gzip': '.gz'}
+
+
+def stored_variant(path):
+    """Return (encoding, file_path) for the stored variant of `path`, or
+    (None, None) if nothing is stored."""
+    for encoding, suffix in ENCODING_SUFFIXES.items():
+        if os.path.isfile(path + suffix):
+            return encoding, path + suffix
+    return None, None
+
+
+def accepted_encodings(header):
+    """Parse an Accept-Encoding header into a set of codings. q-values are
+    ignored except for q=0, which excludes the coding."""
+    accepted = {'identity'}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        if params.replace(' ', '') in ('q=0', 'q=0.0'):
+            accepted.discard(coding)
+        else:
+            accepted.add(coding)
+    return accepted
 
 
 def compute_etag(path):
@@ -21,13 +63,39 @@ def compute_etag(path):
 
 
 class PUTHandler(SimpleHTTPRequestHandler):
+    # Fault injection, set from the command line. Every GET/PUT first sleeps
+    # `latency` plus up to `jitter` seconds, then fails with 503 with
+    # probability `error_rate`.
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    rng = random.Random()
+
+    # Serializes the precondition check and the write it guards, and keeps
+    # readers from seeing half-written files. Without it, two concurrent
+    # If-Match PUTs against the same ETag could both succeed and lose an
+    # update.
+    store_lock = threading.Lock()
+
+    def _inject_faults(self):
+        """Apply the configured delay; returns True if the request was
+        answered with an injected error."""
+        delay = self.latency + self.rng.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if self.error_rate > 0 and self.rng.random() < self.error_rate:
+            self.send_error(503, 'injected error')
+            return True
+        return False
+
     def _check_preconditions(self, path):
         """Evaluate If-Match and If-None-Match against the current file's ETag.
         Returns (ok, etag) where ok is True if all conditions hold (or none
         were given). Only `If-None-Match: *` is supported; specific etag
         values aren't needed by laut.
         """
-        current_etag = compute_etag(path)
+        _, stored_path = stored_variant(path)
+        current_etag = compute_etag(stored_path) if stored_path else None
         if_match = self.headers.get('If-Match')
         if if_match:
             expected = if_match.strip().strip('"')
@@ -44,24 +112,43 @@ class PUTHandler(SimpleHTTPRequestHandler):
             self.send_header('ETag', f'"{etag}"')
 
     def do_GET(self):
+        if self._inject_faults():
+            return
         # GET on a /traces/ "directory" returns a JSON list of stored
         # filenames. Production caches typically refuse this; the test
         # fixture enables it so `laut verify --debug-preimage-corpus`
         # can build an in-memory index. Listing is debug-only.
         if self.path.rstrip('/') == '/traces':
-            self._serve_listing('/var/lib/cache/traces')
+            self._serve_listing(self.translate_path('/traces'))
             return
 
+        # Serve the stored (possibly precompressed) variant as-is when the
+        # client accepts its encoding. gzip can be transcoded for clients
+        # that don't; the stdlib has no zstd, so those get a 406. The ETag
+        # always names the stored bytes so If-Match stays consistent.
         path = self.translate_path(self.path)
-        etag = compute_etag(path)
-        if etag is None:
+        with self.store_lock:
+            encoding, stored_path = stored_variant(path)
+            if stored_path is not None:
+                etag = compute_etag(stored_path)
+                with open(stored_path, 'rb') as f:
+                    content = f.read()
+        if stored_path is None:
             self.send_error(404)
             return
-        with open(path, 'rb') as f:
-            content = f.read()
+        content_encoding = encoding
+        if encoding not in accepted_encodings(self.headers.get('Accept-Encoding')):
+            if encoding != 'gzip':
+                self.send_error(406)
+                return
+            content = gzip.decompress(content)
+            content_encoding = 'identity'
         self.send_response(200)
         self.send_header('Content-Length', str(len(content)))
         self.send_header('Content-Type', self.guess_type(path))
+        if content_encoding != 'identity':
+            self.send_header('Content-Encoding', content_encoding)
+        self.send_header('Vary', 'Accept-Encoding')
         self._send_etag(etag)
         self.end_headers()
         self.wfile.write(content)
@@ -71,8 +158,17 @@ class PUTHandler(SimpleHTTPRequestHandler):
         # shape: an array of objects, each with at least a `name` field.
         # That leaves room for future `type`/`size`/`mtime` fields without
         # changing the schema.
+        # Compressed variants are listed under their logical name; GET on
+        # that name negotiates the encoding.
         try:
-            names = sorted(os.listdir(dir_path))
+            names = set()
+            for n in os.listdir(dir_path):
+                for suffix in ENCODING_SUFFIXES.values():
+                    if suffix and n.endswith(suffix):
+                        n = n[:-len(suffix)]
+                        break
+                names.add(n)
+            names = sorted(names)
         except FileNotFoundError:
             names = []
         body = json.dumps([{"name": n} for n in names]).encode('utf-8')
@@ -83,28 +179,66 @@ class PUTHandler(SimpleHTTPRequestHandler):
         self.wfile.write(body)
 
     def do_PUT(self):
-        path = self.translate_path(self.path)
-        ok, current_etag = self._check_preconditions(path)
-        if not ok:
-            self.send_response(412)
-            self.end_headers()
+        if self._inject_faults():
             return
-
-        os.makedirs(os.path.dirname(path), exist_ok=True)
+        path = self.translate_path(self.path)
         length = int(self.headers.get('Content-Length', 0))
         data = self.rfile.read(length)
 
-        with open(path, 'wb') as f:
-            f.write(data)
+        # Codings we don't know (nix itself may send e.g. `xz` for `.ls`
+        # files) are stored verbatim under the plain name, as before.
+        encoding = (self.headers.get('Content-Encoding') or 'identity').strip().lower()
+        if encoding not in ENCODING_SUFFIXES:
+            encoding = 'identity'
 
-        new_etag = compute_etag(path)
+        with self.store_lock:
+            ok, current_etag = self._check_preconditions(path)
+            if not ok:
+                self.send_response(412)
+                self.end_headers()
+                return
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            target = path + ENCODING_SUFFIXES[encoding]
+            with open(target, 'wb') as f:
+                f.write(data)
+            # Drop any variant stored under a different encoding.
+            for suffix in ENCODING_SUFFIXES.values():
+                if path + suffix != target and os.path.isfile(path + suffix):
+                    os.remove(path + suffix)
+
+            new_etag = compute_etag(target)
         self.send_response(201)
         self._send_etag(new_etag)
         self.end_headers()
 
 
-if __name__ == '__main__':
-    os.makedirs('/var/lib/cache', exist_ok=True)
-    os.chdir('/var/lib/cache')
-    server = HTTPServer(('0.0.0.0', 9000), PUTHandler)
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--root', default='/var/lib/cache',
+                        help='Directory to serve and store uploads in')
+    parser.add_argument('--bind', default='0.0.0.0', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=9000, help='Port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Fixed delay in seconds added to every GET/PUT')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Extra uniformly random delay of up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Probability of answering a GET/PUT with 503')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed for the jitter/error RNG')
+    args = parser.parse_args()
+
+    PUTHandler.latency = args.latency
+    PUTHandler.jitter = args.jitter
+    PUTHandler.error_rate = args.error_rate
+    PUTHandler.rng = random.Random(args.seed)
+
+    os.makedirs(args.root, exist_ok=True)
+    os.chdir(args.root)
+    server = ThreadingHTTPServer((args.bind, args.port), PUTHandler)
     server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
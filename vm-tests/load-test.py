@@ -0,0 +1,374 @@
+"""Local load test for concurrent signature publication and verification.
+
+Starts `http-cache-server.py` on localhost with the requested latency,
+jitter and error injection, builds a handful of synthetic CA derivations,
+then has N signers run the real `laut sign-and-upload` against every one of
+them at once, so they all race on the same `traces/<input_hash>` files
+through the GET/PUT/If-Match retry loop. Afterwards each derivation is
+checked with `laut verify` against the same cache.
+
+Usage: load-test [--laut PATH] [--signers N] [--derivations K]
+                 [--latency S] [--jitter S] [--error-rate P] ...
+
+Needs `nix` (with ca-derivations) and a `laut` binary; no network. Reports
+uploads/sec, conflict (412) and retry rates, p50/p99 sign and verify
+latencies, and a lost-update check: every signer whose upload succeeded
+must find its signature in the final traces body, matched by the key name
+in the JWS `kid`. Exits non-zero if any update was lost.
+"""
+
+import argparse
+import base64
+import concurrent.futures
+import gzip
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "http-cache-server.py")
+
+NIX_CONFIG = "extra-experimental-features = nix-command ca-derivations"
+
+# `"PUT /traces/<hash> HTTP/1.1" 412 -` in the server's request log.
+REQUEST_LOG = re.compile(r'"(GET|PUT) /traces/(\S+) HTTP/[\d.]+" (\d{3})')
+
+DRV_EXPR = """
+builtins.genList (i: derivation {{
+  name = "laut-load-${{toString i}}";
+  system = builtins.currentSystem;
+  builder = "{shell}";
+  args = [ "-c" "echo {nonce}-${{toString i}} > $out" ];
+  __contentAddressed = true;
+  outputHashMode = "recursive";
+  outputHashAlgo = "sha256";
+}}) {count}
+"""
+
+
+def run(cmd, env, **kwargs):
+    return subprocess.run(cmd, env=env, check=True, capture_output=True, text=True, **kwargs)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile; None for an empty sample."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+class CacheServer:
+    """`http-cache-server.py` on a free localhost port, logging to `log_path`."""
+
+    def __init__(self, root, log_path, args, error_rate):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.log_path = log_path
+        cmd = [
+            sys.executable, SERVER,
+            "--root", root,
+            "--bind", "127.0.0.1",
+            "--port", str(self.port),
+            "--latency", str(args.latency),
+            "--jitter", str(args.jitter),
+            "--error-rate", str(error_rate),
+        ]
+        if args.seed is not None:
+            cmd += ["--seed", str(args.seed)]
+        self.log = open(log_path, "w")
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=self.log)
+        self._wait_ready()
+
+    def _wait_ready(self, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"cache server exited early; see {self.log_path}")
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=0.2):
+                    return
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError(f"cache server did not come up within {timeout}s")
+
+    def stop(self):
+        self.proc.terminate()
+        self.proc.wait()
+        self.log.close()
+
+    def status_counts(self):
+        """{(method, status): count} over the /traces/ requests logged so far."""
+        counts = {}
+        with open(self.log_path) as f:
+            for line in f:
+                m = REQUEST_LOG.search(line)
+                if m:
+                    key = (m.group(1), int(m.group(3)))
+                    counts[key] = counts.get(key, 0) + 1
+        return counts
+
+
+def build_derivations(args, env):
+    """Instantiate and build `args.derivations` fresh CA derivations; returns
+    [(drv_path, out_path)]. The nonce keeps input hashes unique per run."""
+    nonce = f"{time.time_ns()}-{random.getrandbits(32)}"
+    expr = DRV_EXPR.format(shell=args.builder_shell, nonce=nonce, count=args.derivations)
+    drvs = run(["nix-instantiate", "--expr", expr], env).stdout.split()
+    built = []
+    for drv in drvs:
+        out = run(["nix-store", "--realise", drv], env).stdout.strip()
+        built.append((drv, out))
+    return built
+
+
+def generate_keys(count, key_dir, env):
+    """[(key_name, secret_key_file, public_key_file)] for `count` signers."""
+    keys = []
+    for i in range(count):
+        name = f"laut-load-signer{i}"
+        secret = os.path.join(key_dir, f"{name}.private")
+        public = os.path.join(key_dir, f"{name}.public")
+        sk = run(["nix", "key", "generate-secret", "--key-name", name], env).stdout
+        with open(secret, "w") as f:
+            f.write(sk)
+        pk = run(["nix", "key", "convert-secret-to-public"], env, input=sk).stdout
+        with open(public, "w") as f:
+            f.write(pk)
+        keys.append((name, secret, public))
+    return keys
+
+
+def sign_all(signer, drvs, url, args, env):
+    """One signer publishing every derivation, in its own shuffled order.
+    Returns [(drv, ok, seconds, stderr)]."""
+    name, secret, _ = signer
+    order = list(drvs)
+    rng = random.Random(f"{args.seed}-{name}") if args.seed is not None else random.Random()
+    rng.shuffle(order)
+    results = []
+    for drv, out in order:
+        cmd = [
+            args.laut, "sign-and-upload", drv,
+            "--secret-key-file", secret,
+            "--to", url,
+            "--out-paths", out,
+            "--trace-encoding", args.trace_encoding,
+        ]
+        if args.include_preimage:
+            cmd.append("--include-preimage")
+        start = time.monotonic()
+        proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+        results.append((drv, proc.returncode == 0, time.monotonic() - start, proc.stderr))
+    return results
+
+
+def read_trace(url, input_hash):
+    """Signatures stored under `input_hash`, or [] if there is no body.
+    Injected 503s are retried; this read is bookkeeping, not under test."""
+    request = urllib.request.Request(
+        f"{url}/traces/{input_hash}", headers={"Accept-Encoding": "gzip"}
+    )
+    for _ in range(50):
+        try:
+            with urllib.request.urlopen(request) as resp:
+                body = resp.read()
+                if resp.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+            return json.loads(body).get("signatures", [])
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return []
+            if e.code != 503:
+                raise
+    raise RuntimeError(f"could not read traces/{input_hash}: too many injected errors")
+
+
+def kid_name(jws):
+    header_b64 = jws.split(".", 1)[0]
+    header = json.loads(base64.urlsafe_b64decode(header_b64 + "=" * (-len(header_b64) % 4)))
+    return header.get("kid", "").split(":", 1)[0]
+
+
+def store_hash(drv_path):
+    return os.path.basename(drv_path).split("-", 1)[0]
+
+
+def check_lost_updates(url, drvs, keys, sign_results):
+    """Per derivation: signers whose upload succeeded but whose signature is
+    missing from the traces body, plus any duplicated signers."""
+    succeeded = {drv: set() for drv, _ in drvs}
+    for (name, _, _), results in zip(keys, sign_results):
+        for drv, ok, _, _ in results:
+            if ok:
+                succeeded[drv].add(name)
+    report = {}
+    for drv, _ in drvs:
+        stored = [kid_name(jws) for jws in read_trace(url, store_hash(drv))]
+        report[drv] = {
+            "succeeded": len(succeeded[drv]),
+            "stored": len(stored),
+            "lost": sorted(succeeded[drv] - set(stored)),
+            "duplicated": sorted({n for n in stored if stored.count(n) > 1}),
+        }
+    return report
+
+
+def verify_all(drvs, keys, url, args, env):
+    """`laut verify` each derivation concurrently; [(drv, ok, seconds)]."""
+    cmd = [args.laut, "verify", "--cache", url]
+    for _, _, public in keys:
+        cmd += ["--trusted-key", public]
+
+    def verify_one(drv):
+        start = time.monotonic()
+        proc = subprocess.run(cmd + [drv], env=env, capture_output=True, text=True)
+        return drv, proc.returncode == 0, time.monotonic() - start
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.signers) as pool:
+        return list(pool.map(verify_one, [drv for drv, _ in drvs]))
+
+
+def fmt_seconds(value):
+    return "n/a" if value is None else f"{value * 1000:.1f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--laut", default=shutil.which("laut") or "laut", help="laut binary")
+    parser.add_argument("--signers", type=int, default=16, help="Concurrent signers")
+    parser.add_argument("--derivations", type=int, default=4,
+                        help="Synthetic CA derivations every signer publishes")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Server-side delay in seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="Extra random server-side delay of up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Probability of a 503 per request while signing")
+    parser.add_argument("--verify-error-rate", type=float, default=0.0,
+                        help="Probability of a 503 per request while verifying")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed for server fault injection and signer order")
+    # No zstd: the lost-update check reads bodies back with the stdlib.
+    parser.add_argument("--trace-encoding", default="gzip", choices=["gzip", "identity"])
+    parser.add_argument("--include-preimage", action="store_true",
+                        help="Sign with --include-preimage (larger bodies)")
+    parser.add_argument("--builder-shell", default="/bin/sh",
+                        help="Shell visible inside the build sandbox")
+    parser.add_argument("--keep", action="store_true", help="Keep the work directory")
+    parser.add_argument("--json", metavar="FILE", help="Also write the summary as JSON")
+    args = parser.parse_args()
+
+    env = dict(os.environ, NIX_CONFIG=NIX_CONFIG)
+    work = tempfile.mkdtemp(prefix="laut-load-")
+    cache_root = os.path.join(work, "cache")
+    try:
+        drvs = build_derivations(args, env)
+        keys = generate_keys(args.signers, work, env)
+
+        server = CacheServer(cache_root, os.path.join(work, "sign.log"), args, args.error_rate)
+        try:
+            start = time.monotonic()
+            with concurrent.futures.ThreadPoolExecutor(max_workers=args.signers) as pool:
+                sign_results = list(
+                    pool.map(lambda k: sign_all(k, drvs, server.url, args, env), keys)
+                )
+            sign_wall = time.monotonic() - start
+        finally:
+            server.stop()
+        sign_counts = server.status_counts()
+
+        # Fresh server on the same root so verify can use its own error rate;
+        # it's also the one the lost-update check reads through.
+        server = CacheServer(cache_root, os.path.join(work, "verify.log"), args,
+                             args.verify_error_rate)
+        try:
+            lost = check_lost_updates(server.url, drvs, keys, sign_results)
+            start = time.monotonic()
+            verify_results = verify_all(drvs, keys, server.url, args, env)
+            verify_wall = time.monotonic() - start
+        finally:
+            server.stop()
+    finally:
+        if args.keep:
+            print(f"work directory: {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+    flat = [r for results in sign_results for r in results]
+    ok_latencies = [secs for _, ok, secs, _ in flat if ok]
+    uploads = len(ok_latencies)
+    max_retries = sum(1 for _, ok, _, err in flat if not ok and "exceeded" in err)
+    puts = sum(n for (method, _), n in sign_counts.items() if method == "PUT")
+    conflicts = sign_counts.get(("PUT", 412), 0) + sign_counts.get(("PUT", 409), 0)
+    injected = sum(n for (_, status), n in sign_counts.items() if status == 503)
+    verify_latencies = [secs for _, _, secs in verify_results]
+    lost_total = sum(len(r["lost"]) for r in lost.values())
+
+    summary = {
+        "signers": args.signers,
+        "derivations": args.derivations,
+        "attempted": len(flat),
+        "uploads": uploads,
+        "failed": len(flat) - uploads,
+        "failed_max_retries": max_retries,
+        "uploads_per_sec": uploads / sign_wall if sign_wall else None,
+        "put_requests": puts,
+        "conflicts": conflicts,
+        "conflict_rate": conflicts / puts if puts else None,
+        "retries_per_upload": conflicts / len(flat) if flat else None,
+        "injected_errors": injected,
+        "sign_p50": percentile(ok_latencies, 50),
+        "sign_p99": percentile(ok_latencies, 99),
+        "verified": sum(1 for _, ok, _ in verify_results if ok),
+        "verify_wall": verify_wall,
+        "verify_p50": percentile(verify_latencies, 50),
+        "verify_p99": percentile(verify_latencies, 99),
+        "lost_updates": lost_total,
+        "per_derivation": lost,
+    }
+
+    print(f"signers x derivations     {args.signers} x {args.derivations}")
+    print(f"uploads                   {uploads}/{len(flat)} in {sign_wall:.2f}s "
+          f"({summary['uploads_per_sec'] or 0:.1f}/s)")
+    print(f"failed uploads            {len(flat) - uploads} "
+          f"({max_retries} hit MaxRetries)")
+    print(f"PUT conflicts (412/409)   {conflicts}/{puts} "
+          f"(rate {summary['conflict_rate'] or 0:.2%}, "
+          f"{summary['retries_per_upload'] or 0:.2f} retries/upload)")
+    print(f"injected 503s             {injected}")
+    print(f"sign latency p50/p99      {fmt_seconds(summary['sign_p50'])} / "
+          f"{fmt_seconds(summary['sign_p99'])}")
+    print(f"verified                  {summary['verified']}/{len(verify_results)} "
+          f"in {verify_wall:.2f}s")
+    print(f"verify latency p50/p99    {fmt_seconds(summary['verify_p50'])} / "
+          f"{fmt_seconds(summary['verify_p99'])}")
+    print(f"lost updates              {lost_total}")
+    for drv, r in lost.items():
+        if r["lost"] or r["duplicated"]:
+            print(f"  {drv}: lost {r['lost']} duplicated {r['duplicated']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    return 1 if lost_total else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,12 +10,16 @@ Both signers' signatures must be tampered: the orchestrator only fires
 the probe when the post-verify signature list is empty, so leaving any
 valid signature behind means the probe never runs.
 
+The VM builders upload gzip-compressed bodies, which the cache stores as
+`<hash>.gz`; the victim is read and written back in its own encoding.
+
 We don't re-sign — the corpus builder is permissive (parses the JWS
 payload without verifying), and the regular verify path rejects the
 broken signatures, causing a miss and firing the probe.
 """
 
 import base64
+import gzip
 import json
 import os
 import sys
@@ -40,18 +44,22 @@ def tamper_jws(jws, marker):
 
 
 def main(trace_dir, marker):
-    victim_name = sorted(os.listdir(trace_dir))[0]
+    # zstd bodies can't be rewritten with the stdlib; skip them.
+    victim_name = sorted(
+        n for n in os.listdir(trace_dir) if not n.endswith(".zst")
+    )[0]
     victim_path = os.path.join(trace_dir, victim_name)
-    with open(victim_path) as f:
+    opener = gzip.open if victim_name.endswith(".gz") else open
+    with opener(victim_path, "rt") as f:
         body = json.load(f)
     tampered = [tamper_jws(jws, marker) for jws in body["signatures"]]
     body["signatures"] = [jws for jws, _ in tampered]
     drv_name = tampered[0][1] if tampered else None
-    with open(victim_path, "w") as f:
+    with opener(victim_path, "wt") as f:
         json.dump(body, f)
     # Stdout doubles as a smoke check for the test driver.
     print("victim_drv_name", drv_name)
-    print("victim_hash", victim_name)
+    print("victim_hash", victim_name.removesuffix(".gz"))
     print("tampered_signature_count", len(body["signatures"]))
 
 